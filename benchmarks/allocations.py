@@ -0,0 +1,66 @@
+"""
+Measures the memory allocated per element while building documents.
+
+For each construct, the memory allocated (as reported by tracemalloc) and
+the number of objects tracked by the garbage collector are reported per
+element, measured with nested elements kept open so that their bookkeeping
+objects are all alive at the same time.
+
+Usage: python benchmarks/allocations.py
+"""
+
+import gc
+import tracemalloc
+
+from yattag import SimpleDoc, Doc
+
+DEPTH = 500
+
+def nested_tags(doc, depth):
+    if depth:
+        with doc.tag('div'):
+            nested_tags(doc, depth - 1)
+    else:
+        snapshot()
+
+def nested_tags_with_attrs(doc, depth):
+    if depth:
+        with doc.tag('div', klass = 'row'):
+            nested_tags_with_attrs(doc, depth - 1)
+    else:
+        snapshot()
+
+def nested_options(doc, depth):
+    # textarea/select/option tags can't be nested, so only one level here
+    with doc.select(name = 'color'):
+        with doc.option(value = 'red'):
+            snapshot()
+
+measures = []
+
+def snapshot():
+    measures.append((tracemalloc.get_traced_memory()[0], len(gc.get_objects())))
+
+def measure(label, function, doc_class, depth):
+    del measures[:]
+    doc = doc_class()
+    gc.disable()
+    tracemalloc.start()
+    snapshot()
+    function(doc, depth)
+    tracemalloc.stop()
+    gc.enable()
+    (start_memory, start_objects), (memory, objects) = measures
+    print('%-28s %8.1f bytes %6.2f gc objects per open element' % (
+        label,
+        (memory - start_memory) / float(depth),
+        (objects - start_objects) / float(depth)
+    ))
+
+def main():
+    measure('tag() without attributes', nested_tags, SimpleDoc, DEPTH)
+    measure('tag() with attributes', nested_tags_with_attrs, SimpleDoc, DEPTH)
+    measure('select() and option()', nested_options, Doc, 2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Compares html_escape and attr_escape with the previous implementation
+(three chained str.replace calls), and with an EscapeMemo in front of them.
+
+Usage: python benchmarks/escape.py
+"""
+
+import timeit
+
+from yattag.simpledoc import html_escape, attr_escape, EscapeMemo
+
+def previous_html_escape(s):
+    if isinstance(s,(int,float)):
+        return str(s)
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def previous_attr_escape(s):
+    if isinstance(s,(int,float)):
+        return str(s)
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace('"', "&quot;")
+
+INPUTS = (
+    ('short', 'Dark chocolate', 200000),
+    ('short, special', 'Salt & pepper', 200000),
+    ('long', 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 200, 5000),
+    ('long, special-heavy', '<a href="/?x=1&y=2">link</a>' * 400, 5000),
+    ('number', 1234, 200000),
+)
+
+def main():
+    for name, previous, current in (
+        ('html_escape', previous_html_escape, html_escape),
+        ('attr_escape', previous_attr_escape, attr_escape),
+    ):
+        memo = EscapeMemo(1024, current)
+        print(name)
+        print('    %-22s %10s %10s %10s' % ('input', 'previous', 'current', 'memo'))
+        for label, value, number in INPUTS:
+            print('    %-22s %9.1fms %9.1fms %9.1fms' % ((label,) + tuple(
+                1000 * timeit.timeit(lambda: function(value), number = number)
+                for function in (previous, current, memo)
+            )))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""
+Compares indent and indent_parallel on a large document (20 MB by default,
+or the size given on the command line, in megabytes), with 1, 2 and
+as many worker processes as CPUs.
+
+Usage: python benchmarks/indent_parallel.py [size in MB]
+"""
+
+import os
+import sys
+import time
+
+from yattag.indentation import indent, indent_parallel
+
+sys.path.insert(0, os.path.dirname(__file__))
+from indentation import make_document
+
+def measure(label, function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    duration = time.perf_counter() - start
+    print('    %-20s %8.3f s' % (label, duration))
+    return result
+
+def main():
+    size = float(sys.argv[1]) if len(sys.argv) > 1 else 20
+    document = make_document(int(size * 1e6))
+    print('document (%.1f MB), %d CPUs' % (len(document) / 1e6, os.cpu_count() or 1))
+    expected = measure('indent', indent, document)
+    for processes in sorted(set([1, 2, os.cpu_count() or 1])):
+        result = measure(
+            'indent_parallel (%d)' % processes, indent_parallel, document,
+            processes = processes, chunk_size = len(document) // (4 * processes) + 1
+        )
+        assert result == expected
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Measures the time taken by yattag.indentation to tokenize (into a list of
+tokens or a TokenStream) and to indent generated html documents of 1 MB,
+10 MB and 100 MB (or of the sizes given on the command line, in megabytes).
+
+Usage: python benchmarks/indentation.py [size in MB] ...
+"""
+
+import sys
+import time
+
+from yattag import SimpleDoc
+from yattag.indentation import indent, tokenize, tokenize_stream
+
+def make_document(size):
+    doc, tag, text, line = SimpleDoc().ttl()
+    doc.asis('<!DOCTYPE html>')
+    with tag('html'):
+        with tag('body'):
+            i = 0
+            while len(doc.result) * 12 < size: # about 12 characters per item
+                with tag('div', klass = 'row', id = 'row-%d' % i):
+                    line('span', 'item %d' % i, klass = 'label')
+                    doc.stag('br')
+                    with tag('p'):
+                        text('Some text with ')
+                        line('strong', 'bold')
+                        text(' words.')
+                    doc.asis('<!-- row %d -->' % i)
+                i += 1
+    return doc.getvalue()
+
+def measure(label, function, *args):
+    start = time.perf_counter()
+    function(*args)
+    duration = time.perf_counter() - start
+    print('    %-16s %8.2f s' % (label, duration))
+
+def main():
+    sizes = [float(arg) for arg in sys.argv[1:]] or [1, 10, 100]
+    for size in sizes:
+        document = make_document(size * 1e6)
+        print('%.1f MB' % (len(document) / 1e6))
+        measure('tokenize', tokenize, document)
+        measure('tokenize_stream', tokenize_stream, document)
+        measure('indent', indent, document)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Measures the peak memory and the time needed to build a large table
+and get its value, with and without the `compact` option of SimpleDoc.
+
+Usage: python benchmarks/large_document.py [number of rows]
+"""
+
+import sys
+import time
+import tracemalloc
+
+from yattag import SimpleDoc
+
+def build(doc, rows):
+    tag, text = doc.tag, doc.text
+    with tag('table'):
+        for i in range(rows):
+            with tag('tr', klass = 'row'):
+                with tag('td'):
+                    text(i)
+                with tag('td'):
+                    text('item')
+
+def measure(rows, compact):
+    start = time.perf_counter()
+    doc = SimpleDoc(compact = compact)
+    build(doc, rows)
+    value = doc.getvalue()
+    duration = time.perf_counter() - start
+
+    tracemalloc.start()
+    doc = SimpleDoc(compact = compact)
+    build(doc, rows)
+    doc.getvalue()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('compact=%-5s %8.1f MB peak %7.2f s (%d characters)' % (
+        compact, peak / 1e6, duration, len(value)
+    ))
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    for compact in (False, True):
+        measure(rows, compact)
+
+if __name__ == '__main__':
+    main()
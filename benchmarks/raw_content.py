@@ -0,0 +1,38 @@
+"""
+Measures the time taken to tokenize and indent documents containing a large
+inline script, style sheet, comment or CDATA section (10 MB by default,
+or the size given on the command line, in megabytes).
+
+Usage: python benchmarks/raw_content.py [size in MB]
+"""
+
+import sys
+import time
+
+from yattag.indentation import indent, tokenize
+
+def make_documents(size):
+    line = 'var data = {"key": "<value>", "list": [1, 2, 3]}; // a < b -- c\n'
+    body = line * int(size / len(line))
+    return [
+        ('script', '<html><body><script type="text/javascript">%s</script></body></html>' % body),
+        ('style', '<html><head><style>%s</style></head></html>' % body.replace('<', ' ')),
+        ('comment', '<html><body><!--%s--></body></html>' % body.replace('--', '- ')),
+        ('cdata', '<root><![CDATA[%s]]></root>' % body),
+    ]
+
+def measure(label, function, *args):
+    start = time.perf_counter()
+    function(*args)
+    duration = time.perf_counter() - start
+    print('    %-10s %8.3f s' % (label, duration))
+
+def main():
+    size = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    for name, document in make_documents(size * 1e6):
+        print('%s (%.1f MB)' % (name, len(document) / 1e6))
+        measure('tokenize', tokenize, document)
+        measure('indent', indent, document)
+
+if __name__ == '__main__':
+    main()
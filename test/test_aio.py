@@ -0,0 +1,100 @@
+import asyncio
+import unittest
+from yattag import SimpleDoc, Doc
+from yattag.aio import render_async
+
+
+def collect(async_iterator):
+    async def consume():
+        return [chunk async for chunk in async_iterator]
+    return asyncio.run(consume())
+
+
+class TestRenderAsync(unittest.TestCase):
+
+    def test_chunks(self):
+        def page(doc):
+            with doc.tag('ul'):
+                for i in range(1000):
+                    doc.line('li', 'café %d' % i)
+                    yield
+
+        expected = SimpleDoc()
+        for _ in page(expected):
+            pass
+
+        chunks = collect(render_async(page, chunk_size = 500))
+        self.assertTrue(len(chunks) > 10)
+        self.assertTrue(all(isinstance(chunk, bytes) for chunk in chunks))
+        self.assertEqual(b''.join(chunks).decode('utf-8'), expected.getvalue())
+
+        chunks = collect(render_async(page, chunk_size = 500, encoding = 'utf-16'))
+        self.assertEqual(b''.join(chunks), expected.getvalue().encode('utf-16'))
+
+    def test_plain_function(self):
+        def page(doc):
+            with doc.select(name = 'color'):
+                for color in ('red', 'blue'):
+                    with doc.option(value = color):
+                        doc.text(color)
+
+        chunks = collect(render_async(page, doc_class = Doc, defaults = {'color': 'blue'}))
+        self.assertEqual(
+            b''.join(chunks),
+            b'<select name="color"><option value="red">red</option>'
+            b'<option value="blue" selected="selected">blue</option></select>'
+        )
+
+    def test_coroutine_function(self):
+        async def page(doc):
+            with doc.tag('ul'):
+                for i in range(3):
+                    await asyncio.sleep(0)
+                    doc.line('li', str(i))
+
+        chunks = collect(render_async(page))
+        self.assertEqual(b''.join(chunks), b'<ul><li>0</li><li>1</li><li>2</li></ul>')
+
+    def test_async_generator_function(self):
+        async def page(doc):
+            with doc.tag('ul'):
+                for i in range(1000):
+                    await asyncio.sleep(0)
+                    doc.line('li', str(i))
+                    yield
+
+        expected = SimpleDoc()
+        with expected.tag('ul'):
+            for i in range(1000):
+                expected.line('li', str(i))
+
+        chunks = collect(render_async(page, chunk_size = 500))
+        self.assertTrue(len(chunks) > 10)
+        self.assertEqual(b''.join(chunks).decode('utf-8'), expected.getvalue())
+
+    def test_cancel(self):
+        progress = []
+
+        def page(doc):
+            try:
+                with doc.tag('ul'):
+                    for i in range(10000):
+                        doc.line('li', str(i))
+                        progress.append(i)
+                        yield
+            finally:
+                progress.append('closed')
+
+        async def consume():
+            chunks = render_async(page, chunk_size = 100)
+            async for chunk in chunks:
+                break
+            await chunks.aclose()
+
+        asyncio.run(consume())
+        self.assertEqual(progress[-1], 'closed')
+        self.assertTrue(len(progress) < 10000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import io
+import sys
+import time
+import unittest
+from yattag import SimpleDoc
+from yattag.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_eviction(self):
+        cache = LRUCache(maxsize = 2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(
+            cache.stats(),
+            {'hits': 3, 'misses': 1, 'evictions': 1, 'size': 2, 'maxsize': 2,
+             'bytes': 2 * sys.getsizeof(1), 'maxbytes': None}
+        )
+
+    def test_maxbytes(self):
+        cache = LRUCache(maxbytes = 10, sizeof = len)
+        cache.set('a', 'aaaa')
+        cache.set('b', 'bbbb')
+        self.assertEqual(cache.get('a'), 'aaaa')
+        cache.set('c', 'cccc')
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.nbytes, 8)
+        cache.set('a', 'a')
+        self.assertEqual(cache.nbytes, 5)
+        cache.set('d', 'x' * 11) # too large to be stored
+        self.assertEqual(cache.get('d'), None)
+        self.assertEqual(len(cache), 2)
+        cache.set('d', 'dddddd')
+        self.assertEqual(cache.get('c'), None)
+        self.assertEqual(cache.get('a'), 'a')
+        stats = cache.stats()
+        self.assertEqual((stats['bytes'], stats['maxbytes'], stats['evictions']), (7, 10, 2))
+        cache.discard('a')
+        self.assertEqual(cache.nbytes, 6)
+        cache.clear()
+        self.assertEqual(cache.nbytes, 0)
+
+    def test_ttl(self):
+        cache = LRUCache()
+        cache.set('a', 1, ttl = 0.01)
+        cache.set('b', 2, ttl = 60)
+        time.sleep(0.02)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('b'), 2)
+        self.assertEqual(len(cache), 1)
+
+
+class TestCachedFragment(unittest.TestCase):
+
+    def render(self, doc, cache, calls):
+        with doc.tag('body'):
+            for lang in ('en', 'fr', 'en'):
+                with doc.cached(('footer', lang), cache) as missed:
+                    if missed:
+                        calls.append(lang)
+                        with doc.tag('footer', lang = lang):
+                            doc.text('(c) ' + lang)
+            doc.attr(id = 'page')
+
+    def test_cached(self):
+        cache = LRUCache()
+        calls = []
+        for i in range(2):
+            doc = SimpleDoc()
+            self.render(doc, cache, calls)
+            self.assertEqual(
+                doc.getvalue(),
+                '<body id="page"><footer lang="en">(c) en</footer>'
+                '<footer lang="fr">(c) fr</footer>'
+                '<footer lang="en">(c) en</footer></body>'
+            )
+        self.assertEqual(calls, ['en', 'fr'])
+        self.assertEqual(cache.stats()['hits'], 4)
+
+    def test_cached_streaming(self):
+        cache = LRUCache()
+        sink = io.StringIO()
+        doc = SimpleDoc(sink = sink, chunk_size = 10)
+        with doc.tag('body', id = 'page'):
+            for i in range(300):
+                with doc.cached(i % 3, cache) as missed:
+                    if missed:
+                        doc.line('p', str(i % 3))
+        doc.flush()
+        self.assertEqual(
+            sink.getvalue(),
+            '<body id="page">' + '<p>0</p><p>1</p><p>2</p>' * 100 + '</body>'
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 import unittest
-from yattag import Doc
+from yattag import Doc, OptionList
+from yattag.cache import LRUCache
+from yattag.simpledoc import DocError
 import xml.etree.ElementTree as ET
 
 class TestDoc(unittest.TestCase):
@@ -139,7 +141,131 @@ class TestDoc(unittest.TestCase):
         self.assertEqual(
             root[2].attrib['checked'], 'checked'
         )
-       
+
+    def test_streamed_form(self):
+        def build(doc):
+            with doc.tag('form'):
+                for i in range(300):
+                    with doc.select(name = 'sel%d' % i):
+                        with doc.option(value = 'a'):
+                            doc.text('A')
+                        with doc.option(value = 'b'):
+                            doc.text('B')
+                    with doc.textarea(name = 'text%d' % i):
+                        doc.text('default <%d>' % i)
+
+        expected = Doc(defaults = {'sel3': 'b', 'text4': 'changed'})
+        build(expected)
+        chunks = []
+        doc = Doc(defaults = {'sel3': 'b', 'text4': 'changed'}, sink = chunks.append, chunk_size = 200)
+        build(doc)
+        doc.flush()
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(''.join(chunks), expected.getvalue())
+
+    def test_detached_errors(self):
+        doc = Doc(errors = {'name': 'Required', 'form': 'Try again'})
+        doc.detached_errors()
+        doc.input('name', type = 'text')
+        expected = '<ul class="error-list"><li>Try again</li></ul>'
+        self.assertTrue(doc.getvalue().startswith(expected))
+        self.assertTrue(doc.getvalue().startswith(expected))
+        doc.errors['form'] = 'Try later'
+        self.assertTrue(b''.join(doc.iterencode()).startswith(b'<ul class="error-list"><li>Try later</li></ul>'))
+        doc.input('form', type = 'hidden')
+        self.assertTrue(doc.getvalue().startswith('<span class="error">Required</span><input'))
+
+        doc = Doc(errors = {'form': 'Try again'}, compact = True, chunk_size = 100)
+        with doc.tag('form'):
+            doc.detached_errors()
+            for i in range(1000):
+                doc.input('field%d' % i, type = 'text')
+            self.assertTrue(len(doc.result) < 300)
+        self.assertTrue(doc.getvalue().startswith('<form><ul class="error-list"><li>Try again</li></ul>'))
+
+        cache = LRUCache()
+        doc = Doc(errors = {'form': 'Try again'})
+        doc.asis('<p>intro</p>')
+        def in_cached_fragment():
+            with doc.cached('fragment', cache):
+                doc.detached_errors()
+        self.assertRaises(DocError, in_cached_fragment)
+        self.assertEqual(len(cache), 0)
+        def in_capture():
+            with doc.capture(lambda content: content):
+                doc.detached_errors()
+        self.assertRaises(DocError, in_capture)
+        self.assertEqual(doc.getvalue(), '<p>intro</p>')
+
+    def test_indexed_defaults(self):
+        doc = Doc(defaults = {'ids': [1, 2, '3'], 'tag': ('a', 'b')})
+        with doc.tag('body'):
+            for value in ('1', 2, 3, '4'):
+                doc.input('ids', type = 'checkbox', value = value)
+            doc.input('tag', type = 'checkbox', value = 'b')
+        root = ET.fromstring(doc.getvalue())
+        self.assertEqual(
+            [child.attrib.get('checked') for child in root],
+            ['checked', 'checked', 'checked', None, 'checked']
+        )
+        # replacing the value of a field is taken into account
+        doc = Doc(defaults = {'ids': ['1']})
+        doc.input('ids', type = 'checkbox', value = '1')
+        doc.defaults['ids'] = ['2']
+        doc.input('ids', type = 'checkbox', value = '1')
+        self.assertEqual(
+            doc.getvalue(),
+            '<input type="checkbox" value="1" checked="checked" name="ids" />'
+            '<input type="checkbox" value="1" name="ids" />'
+        )
+
+    def test_options(self):
+        doc = Doc(defaults = {'ingredient': ['chocolate', 'coffee'], 'size': 2})
+        with doc.select(name = 'ingredient', multiple = "multiple"):
+            doc.options([
+                ("chocolate", "Dark Chocolate"),
+                ("almonds", "Roasted & salted almonds"),
+                ("coffee", "Ethiopian coffee"),
+            ], klass = 'ingredient')
+        with doc.select(name = 'size'):
+            doc.options(range(1, 4))
+        self.assertEqual(
+            doc.getvalue(),
+            '<select multiple="multiple" name="ingredient">'
+            '<option value="chocolate" selected="selected" class="ingredient">Dark Chocolate</option>'
+            '<option value="almonds" class="ingredient">Roasted &amp; salted almonds</option>'
+            '<option value="coffee" selected="selected" class="ingredient">Ethiopian coffee</option>'
+            '</select>'
+            '<select name="size">'
+            '<option value="1">1</option>'
+            '<option value="2" selected="selected">2</option>'
+            '<option value="3">3</option>'
+            '</select>'
+        )
+        self.assertRaises(Exception, lambda: Doc().options(['a']))
+
+    def test_option_list(self):
+        items = [(str(i), 'option %d' % i) for i in range(10)] + [(10, 'ten & more')]
+        option_list = OptionList(items, klass = 'opt')
+        for defaults, multiple in (
+            ({}, False),
+            ({'x': '3'}, False),
+            ({'x': 10}, False),
+            ({'x': '10'}, False),
+            ({'x': ['1', '7', 10, 'missing']}, True),
+            ({'x': [str(i) for i in range(10)]}, True),
+        ):
+            attrs = {'multiple': 'multiple'} if multiple else {}
+            expected = Doc(defaults = defaults)
+            with expected.select(name = 'x', **attrs):
+                expected.options(items, klass = 'opt')
+            doc = Doc(defaults = defaults)
+            with doc.select(name = 'x', **attrs):
+                doc.options(option_list)
+            self.assertEqual(doc.getvalue(), expected.getvalue())
+        self.assertEqual(option_list.html.count('selected'), 0)
+
+
 if __name__ == '__main__':
     unittest.main()
         
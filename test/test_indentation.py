@@ -1,6 +1,13 @@
+import contextlib
+import io
+import mmap
+import os
+import shutil
+import tempfile
 import unittest
 import yattag
 from yattag import indent
+from yattag.indentation import indent_stream, indent_many, indent_parallel, main
 
 
 class TestIndent(unittest.TestCase):
@@ -207,6 +214,250 @@ public final class SignInConfiguration implements SafeParcelable {
         within_text = "<p>Here's the data: <![CDATA[6*10]]></p>"
         self.assertEqual(indent(within_text), within_text)
 
+    def test_cache(self):
+        from yattag.cache import LRUCache
+        cache = LRUCache(maxsize = 10)
+        for document, expected in self.targets.items():
+            self.assertEqual(indent(document, indentation = '    ', cache = cache), expected)
+        for document, expected in self.targets.items():
+            self.assertEqual(indent(document, indentation = '    ', cache = cache), expected)
+        self.assertEqual(cache.stats()['hits'], len(self.targets))
+        document = '<p>a\nb</p>'
+        for kwargs in ({}, {'indent_text': yattag.EACH_LINE}, {'indentation': '\t'}, {'newline': '\r\n'}):
+            self.assertEqual(indent(document, cache = cache, **kwargs), indent(document, **kwargs))
+            self.assertEqual(indent(document, cache = cache, **kwargs), indent(document, **kwargs))
+        self.assertEqual(cache.stats()['hits'], len(self.targets) + 4)
+
+    def test_tokenize(self):
+        from yattag.indentation import tokenize, XMLTokenError
+        tokens = tokenize(
+            '<?xml version="1.0"?>< p class="a">x &amp; y<br/>'
+            '<!unknown><!-- <p> --></p ><Script>if (a<b) {}</script >'
+        )
+        self.assertEqual(
+            [(type(token).__name__, token.content, getattr(token, 'tag_name', None)) for token in tokens],
+            [
+                ('XMLDeclaration', '<?xml version="1.0"?>', None),
+                ('OpenTag', '< p class="a">', 'p'),
+                ('Text', 'x &amp; y', None),
+                ('SelfTag', '<br/>', 'br'),
+                ('OpenTag', '<!unknown>', '!unknown'),
+                ('Comment', '<!-- <p> -->', None),
+                ('CloseTag', '</p >', 'p'),
+                ('Script', '<Script>if (a<b) {}</script >', None),
+            ]
+        )
+        self.assertRaises(XMLTokenError, lambda: tokenize('<p>a > b</p>'))
+
+    def test_tokenize_stream(self):
+        from yattag.indentation import tokenize, tokenize_stream, _tokenizer, Tokenizer, TagMatcher, OpenTag, Text
+        document = '<ul>%s</ul><!-- end -->' % ''.join(
+            '<li class="%d">item <b>%d</b></li>\n  ' % (i, i) for i in range(100)
+        )
+        tokenizer = Tokenizer(_tokenizer.token_classes)
+        tokenizer.batch_size = 10 # tokens spanning several batches
+        for stream in (tokenize_stream(document), tokenizer.tokenize_stream(document)):
+            tokens = tokenize(document)
+            self.assertEqual(len(stream), len(tokens))
+            self.assertEqual(
+                [(type(token), token.content, getattr(token, 'tag_name', None)) for token in stream],
+                [(type(token), token.content, getattr(token, 'tag_name', None)) for token in tokens]
+            )
+            self.assertEqual(list(stream.items()), [(type(token), token.content) for token in tokens])
+            self.assertEqual(stream.content(1), '<li class="0">')
+            self.assertEqual(stream.tag_name(1), 'li')
+            self.assertEqual(stream.token_classes[stream.kinds[1]], OpenTag)
+            self.assertEqual(stream.start(1), 4)
+            self.assertTrue(stream.isblank(7))
+            self.assertEqual(stream.token_classes[stream.kinds[7]], Text)
+            self.assertEqual(stream.tag_names, [None, 'ul', 'li', 'b'])
+            matcher = TagMatcher(stream)
+            list_matcher = TagMatcher(tokens)
+            for i in range(len(tokens)):
+                if getattr(tokens[i], 'tag_name', None) is not None:
+                    self.assertEqual(matcher.ismatched(i), list_matcher.ismatched(i))
+                self.assertEqual(matcher.directly_contains_text(i), list_matcher.directly_contains_text(i))
+        self.assertEqual(len(tokenize_stream('')), 0)
+
+    def test_tag_matcher(self):
+        from yattag.indentation import tokenize, tokenize_stream, TagMatcher
+        # crossed and unmatched tags
+        document = '<a>x<b><i>y</a> </b><c> <p></i>z'
+        for tokens in (tokenize(document), tokenize_stream(document)):
+            for blank_is_text, direct_text in ((False, [0, 3]), (True, [0, 2, 3])):
+                matcher = TagMatcher(tokens, blank_is_text = blank_is_text)
+                self.assertEqual(list(matcher.match), [5, -1, 7, 11, -1, 0, -1, 2, -1, -1, -1, 3, -1])
+                self.assertEqual(
+                    [i for i in range(len(tokens)) if matcher.directly_contains_text(i)],
+                    direct_text
+                )
+                self.assertTrue(matcher.ismatched(2))
+                self.assertFalse(matcher.ismatched(8))
+
+    def test_tokenize_raw_content(self):
+        from yattag.indentation import tokenize
+        def kinds(string):
+            return [(type(token).__name__, token.content) for token in tokenize(string)]
+        self.assertEqual(
+            kinds('<script a=\'x>\'>if (a<b) {}</script><!----><style>p{}< /style >'),
+            [
+                ('Script', '<script a=\'x>\'>if (a<b) {}</script>'),
+                ('Comment', '<!---->'),
+                ('Style', '<style>p{}< /style >'),
+            ]
+        )
+        # unterminated script or comment
+        self.assertEqual(kinds('<script>a'), [('OpenTag', '<script>'), ('Text', 'a')])
+        self.assertEqual(kinds('<!--->'), [('OpenTag', '<!--->')])
+
+
+    def test_indent_stream(self):
+        rows = ''.join(
+            '<tr><td>%d</td><td><b>bold</b> text é</td><td><br><!-- %d --></td></tr>\n' % (i, i)
+            for i in range(1000)
+        )
+        document = (
+            '<?xml version="1.0"?><html><body><table>%s</table>'
+            '<script>if (a < b) {}</script></body></html>' % rows
+        )
+        for kwargs in ({}, {'indent_text': yattag.EACH_LINE, 'blank_is_text': True}):
+            expected = indent(document, **kwargs)
+            out = io.StringIO()
+            indent_stream(io.StringIO(document), out, chunk_size = 1000, **kwargs)
+            self.assertEqual(out.getvalue(), expected)
+            chunks = []
+            indent_stream(document.encode('utf-8'), chunks.append, chunk_size = 999, **kwargs)
+            self.assertEqual(''.join(chunks), expected)
+
+        class ReadOnly(object):
+            def __init__(self, fileobj):
+                self.read = fileobj.read
+        for fileobj in (io.StringIO(document), io.BytesIO(document.encode('utf-8'))):
+            out = io.StringIO()
+            indent_stream(ReadOnly(fileobj), out, chunk_size = 1000)
+            self.assertEqual(out.getvalue(), indent(document))
+
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as fileobj:
+                fileobj.write(document.encode('utf-8'))
+            out = io.StringIO()
+            indent_stream(path, out, chunk_size = 4000)
+            self.assertEqual(out.getvalue(), indent(document))
+            with open(path, 'rb') as fileobj:
+                with mmap.mmap(fileobj.fileno(), 0, access = mmap.ACCESS_READ) as mapped:
+                    out = io.StringIO()
+                    indent_stream(mapped, out)
+                    self.assertEqual(out.getvalue(), indent(document))
+        finally:
+            os.remove(path)
+
+    def test_indent_stream_long_tag(self):
+        from yattag.indentation import Tokenizer
+        # a tag longer than the lookahead, across a chunk boundary
+        image = '<img src="data:image/png;base64,%s">' % ('A' * (3 * Tokenizer.lookahead))
+        document = '<html><body>%s<p>%s</p>%s</body></html>' % (
+            '<p>text</p>' * 300, image, '<p>text</p>' * 300
+        )
+        out = io.StringIO()
+        indent_stream(io.StringIO(document), out, chunk_size = 4000)
+        self.assertEqual(out.getvalue(), indent(document))
+        out = io.StringIO()
+        self.assertRaises(
+            yattag.indentation.XMLTokenError,
+            lambda: indent_stream(io.StringIO(document + '<p>a > b</p>'), out, chunk_size = 4000)
+        )
+
+    def test_indent_many(self):
+        documents = dict(
+            ('doc%d.xml' % i, '<feed><entry id="%d"><title>%d</title></entry></feed>' % (i, i))
+            for i in range(6)
+        )
+        directory = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        try:
+            os.chdir(directory)
+            os.mkdir('src')
+            for name, document in documents.items():
+                with open(os.path.join('src', name), 'w') as fileobj:
+                    fileobj.write(document)
+
+            results = indent_many(['src/*.xml'], output_dir = 'out', processes = 2, indentation = '\t')
+            self.assertEqual(
+                results,
+                [(os.path.join('src', name), 'indented') for name in sorted(documents)]
+            )
+            for name, document in documents.items():
+                with open(os.path.join('out', 'src', name)) as fileobj:
+                    self.assertEqual(fileobj.read(), indent(document, indentation = '\t') + '\n')
+            self.assertEqual(
+                set(status for path, status in indent_many(['src/*.xml'], output_dir = 'out')),
+                set(['skipped'])
+            )
+
+            self.assertEqual(main(['--in-place', '-j', '1', '--newline', 'crlf', 'src/doc1.xml']), 0)
+            with open(os.path.join('src', 'doc1.xml'), newline = '') as fileobj:
+                self.assertEqual(fileobj.read(), indent(documents['doc1.xml'], newline = '\r\n') + '\r\n')
+            self.assertEqual(
+                indent_many(['src/doc1.xml'], processes = 1, newline = '\r\n'),
+                [('src/doc1.xml', 'unchanged')]
+            )
+
+            # the input is left untouched when the indented file can't be written
+            self.assertRaises(
+                UnicodeEncodeError,
+                lambda: indent_many(['src/doc2.xml'], processes = 1, encoding = 'ascii', indentation = '\xa0')
+            )
+            with open(os.path.join('src', 'doc2.xml')) as fileobj:
+                self.assertEqual(fileobj.read(), documents['doc2.xml'])
+            self.assertEqual(sorted(os.listdir('src')), sorted(documents))
+
+            # a single glob pattern matching one file goes to the standard output
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                self.assertEqual(main(['src/doc3.*']), 0)
+            self.assertEqual(out.getvalue(), indent(documents['doc3.xml']) + '\n')
+            with contextlib.redirect_stderr(io.StringIO()):
+                self.assertRaises(SystemExit, lambda: main(['src/doc*.xml']))
+                self.assertRaises(SystemExit, lambda: main(['src/none*.xml']))
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(directory)
+
+    def test_indent_parallel(self):
+        document = ''.join(
+            '<div id="%d"><!-- <p> --><script>if (a <b) {}</script>'
+            '<p>text %d <b>bold</b></p><br><![CDATA[ <x> ]]></div>' % (i, i)
+            for i in range(200)
+        )
+        for chunk_size in (7, 100, 1000):
+            for processes in (1, 2):
+                self.assertEqual(
+                    indent_parallel(document, processes = processes, chunk_size = chunk_size),
+                    indent(document)
+                )
+        self.assertEqual(
+            indent_parallel(document, processes = 1, chunk_size = 50, indent_text = yattag.EACH_LINE,
+             indentation = '\t', newline = '\r\n'),
+            indent(document, indent_text = yattag.EACH_LINE, indentation = '\t', newline = '\r\n')
+        )
+        for target, expected in self.targets.items():
+            self.assertEqual(indent_parallel(target, processes = 1, chunk_size = 3, indentation = '    '), expected)
+
+    def test_indent_parallel_chunks(self):
+        from yattag.indentation import _init_worker, _tokenize_range
+        document = '<div><p>a</p><p>b<br></p></div>' * 100
+        _init_worker(document)
+        try:
+            start, stop, kinds, ends, ids, names = _tokenize_range((5, len(document)))
+        finally:
+            _init_worker(None)
+        # the tag names are sent once per chunk, with an array of indexes
+        self.assertEqual(names, [None, 'p', 'br', 'div'])
+        self.assertEqual(ids.typecode, 'I')
+        self.assertEqual(len(ids), len(kinds))
+        self.assertEqual(list(ids[:6]), [1, 0, 1, 1, 0, 2])
+        self.assertEqual(ends[0], 8)
 
 
 if __name__ == '__main__':
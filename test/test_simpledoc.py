@@ -1,8 +1,14 @@
+import io
+import pickle
+import re
+import tracemalloc
 import unittest
 from yattag import SimpleDoc, AsIs
 import xml.etree.ElementTree as ET
 
-from yattag.simpledoc import format_attr_value
+from yattag.simpledoc import format_attr_value, dict_to_attrs, DocError
+from yattag.simpledoc import html_escape, attr_escape, EscapeMemo
+from yattag.simpledoc import TextFilter, collapse_whitespace_filter
 
 class TestSimpledoc(unittest.TestCase):
 
@@ -38,6 +44,19 @@ class TestSimpledoc(unittest.TestCase):
             lambda: root[1].attrib['klass']
         )
 
+    def test_attrs_on_tag_without_attributes(self):
+        doc, tag, text = SimpleDoc().tagtext()
+        with tag('ul'):
+            doc.discard_class('missing')
+            with tag('li'):
+                doc.toggle_class('active', True)
+            with tag('li'):
+                doc.attr(id = 'second')
+        self.assertEqual(
+            doc.getvalue(),
+            '<ul><li class="active"></li><li id="second"></li></ul>'
+        )
+
     def test_attrs_no_value(self):
         doc, tag, text = SimpleDoc().tagtext()
         with tag('paper-button', 'raised'):
@@ -115,6 +134,29 @@ class TestSimpledoc(unittest.TestCase):
             )
         )
 
+    def test_lines(self):
+        doc = SimpleDoc()
+        doc.lines('li', ['Salt & pepper', 42], klass = 'ingredient')
+        doc.lines('td', [])
+        self.assertEqual(
+            doc.getvalue(),
+            '<li class="ingredient">Salt &amp; pepper</li><li class="ingredient">42</li>'
+        )
+
+        doc = SimpleDoc(nl2br = True, stag_end = '>')
+        doc.lines('p', iter(['a\nb', 'c']))
+        self.assertEqual(doc.getvalue(), '<p>a<br>b</p><p>c</p>')
+
+    def test_stags(self):
+        doc = SimpleDoc(stag_end = '>')
+        doc.stags('img', [{'src': 'a.png'}, None, {'src': 'b.png', 'class': 'big'}], klass = 'thumbnail')
+        doc.stags('br', [None, None])
+        self.assertEqual(
+            doc.getvalue(),
+            '<img class="thumbnail" src="a.png"><img class="thumbnail">'
+            '<img class="big" src="b.png"><br><br>'
+        )
+
     def test_stag(self):
         doc = SimpleDoc()
         doc.stag('img', src = '/salmon-plays-piano.jpg')
@@ -161,6 +203,38 @@ class TestSimpledoc(unittest.TestCase):
         doc.text("&")
         self.assertEqual(doc.getvalue(), "&amp;")
 
+    def test_text_filters(self):
+        mentions = TextFilter(
+            r'@(?P<user>\w+)',
+            lambda match: '<a href="/users/%s">@%s</a>' % ((match.group('user'),) * 2)
+        )
+        doc = SimpleDoc(nl2br = True, text_filters = [mentions, collapse_whitespace_filter()])
+        doc.text('Hi   @max,\nthanks  &  bye!')
+        self.assertEqual(
+            doc.getvalue(),
+            'Hi <a href="/users/max">@max</a>,<br />thanks &amp; bye!'
+        )
+
+        doc = SimpleDoc(
+            text_filters = [TextFilter('yattag', '<b>yattag</b>', re.I)],
+            escape_memo = 10
+        )
+        doc.text('YATTAG \\o/', 'YATTAG \\o/')
+        self.assertEqual(doc.getvalue(), '<b>yattag</b> \\o/' * 2)
+
+    def test_pickle_text_filters(self):
+        for kwargs in (
+            {'nl2br': True},
+            {'nl2br': True, 'text_filters': [collapse_whitespace_filter()], 'escape_memo': 10},
+        ):
+            doc = SimpleDoc(**kwargs)
+            doc.text('a  <b>\nc')
+            copy = pickle.loads(pickle.dumps(doc))
+            copy.text('\nd')
+            doc.text('\nd')
+            self.assertEqual(copy.getvalue(), doc.getvalue())
+            self.assertTrue('<br />' in copy.getvalue())
+
     def test_asis_double_quotes(self):
         doc, tag, text = SimpleDoc().tagtext()
         with tag('elem', data=AsIs("\"{'a':'b'}\"")):
@@ -173,6 +247,281 @@ class TestSimpledoc(unittest.TestCase):
             pass
         self.assertEqual(doc.getvalue(), "<elem data='{\"a\":\"b\"}'></elem>")
 
+    def test_tag_factory(self):
+        doc, tag, text = SimpleDoc().tagtext()
+        td = doc.tag_factory('td', klass = 'num')
+        div = doc.tag_factory('div')
+        with div:
+            with tag('tr'):
+                with td:
+                    text(1)
+                with td:
+                    doc.attr(klass = 'total')
+                    text(2)
+                td.line('3 < 4')
+            with div:
+                doc.attr(id = 'inner')
+                with div:
+                    text('innermost')
+            doc.attr(id = 'outer')
+        self.assertEqual(
+            doc.getvalue(),
+            '<div id="outer"><tr><td class="num">1</td><td class="total">2</td>'
+            '<td class="num">3 &lt; 4</td></tr>'
+            '<div id="inner"><div>innermost</div></div></div>'
+        )
+
+    def test_tag_factory_exception(self):
+        doc, tag, text = SimpleDoc().tagtext()
+        li = doc.tag_factory('li', klass = 'item')
+        with tag('ul'):
+            try:
+                with li:
+                    doc.attr(id = 'failed')
+                    raise ValueError
+            except ValueError:
+                pass
+            with li:
+                text('ok')
+            self.assertIsNone(li.parent_tag)
+            self.assertIsNone(li._attrs)
+        self.assertTrue(doc.getvalue().endswith('<li class="item">ok</li></ul>'))
+
+    def test_partial_getvalue(self):
+        doc, tag, text = SimpleDoc().tagtext()
+        with tag('ul'):
+            for i in range(3):
+                with tag('li'):
+                    text(i)
+            self.assertEqual(doc.getvalue(), '<li>0</li><li>1</li><li>2</li>')
+            doc.attr(id = 'list')
+            with tag('li'):
+                doc.add_class('last')
+                self.assertEqual(doc.getvalue(), '<li>0</li><li>1</li><li>2</li>')
+                text(3)
+        value = doc.getvalue()
+        self.assertEqual(
+            value,
+            '<ul id="list"><li>0</li><li>1</li><li>2</li><li class="last">3</li></ul>'
+        )
+        self.assertEqual(doc.result, [value])
+        self.assertTrue(doc.getvalue() is value)
+        text('!')
+        self.assertEqual(doc.getvalue(), value + '!')
+
+    def test_compact(self):
+        def build(doc, check = False):
+            tag, text = doc.tag, doc.text
+            with tag('table'):
+                for i in range(3000):
+                    with tag('tr'):
+                        with tag('td'):
+                            text(i)
+                    if check and i == 1500:
+                        partial = doc.getvalue()
+                        self.assertTrue(partial.endswith('<tr><td>1500</td></tr>'))
+                doc.attr(id = 'big')
+            text('end')
+
+        expected = SimpleDoc()
+        build(expected)
+        doc = SimpleDoc(compact = True, chunk_size = 1000)
+        build(doc, check = True)
+        self.assertTrue(len(doc.result) < 300)
+        self.assertEqual(doc.getvalue(), expected.getvalue())
+        self.assertTrue(expected.getvalue().startswith('<table id="big"><tr>'))
+
+    def test_encoded_output(self):
+        doc, tag, text = SimpleDoc(chunk_size = 100).tagtext()
+        with tag('ul'):
+            for i in range(100):
+                with tag('li'):
+                    text('élément %d' % i)
+        expected = doc.getvalue().encode('utf-8')
+        chunks = list(doc.iterencode())
+        self.assertTrue(len(chunks) > 10)
+        self.assertEqual(b''.join(chunks), expected)
+        self.assertEqual(b''.join(doc.getbuffers('utf-8', 7)), expected)
+        self.assertEqual(b''.join(doc.getbuffers('latin-1')), doc.getvalue().encode('latin-1'))
+        for encoding in ('utf-16', 'utf-8-sig'):
+            chunks = list(doc.iterencode(encoding, 64))
+            self.assertTrue(len(chunks) > 10)
+            self.assertEqual(b''.join(chunks), doc.getvalue().encode(encoding))
+        fileobj = io.BytesIO()
+        self.assertEqual(doc.write_to(fileobj), len(expected))
+        self.assertEqual(fileobj.getvalue(), expected)
+        self.assertEqual(list(SimpleDoc().iterencode()), [])
+        self.assertRaises(DocError, SimpleDoc(sink = io.StringIO()).iterencode)
+
+    def test_encoded_output_memory(self):
+        doc, tag, text = SimpleDoc().tagtext()
+        with tag('table'):
+            for i in range(20000):
+                with tag('tr'):
+                    with tag('td'):
+                        text('élément %d' % i)
+        size = len(doc.getvalue())
+        self.assertTrue(size > 500000)
+        with tag('p'):
+            text('after getvalue')
+        tracemalloc.start()
+        try:
+            for chunk in doc.iterencode('utf-8', 4096):
+                pass
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertTrue(peak < size // 10)
+
+    def test_capture(self):
+        def build(doc):
+            tag, text, line = doc.tag, doc.text, doc.line
+            with tag('body'):
+                for i in range(300):
+                    with doc.capture(lambda inner: '<div data-length="%d">%s</div>' % (len(inner), inner)):
+                        with doc.capture(str.upper):
+                            line('p', 'item %d' % i)
+                        text('!')
+
+        doc = SimpleDoc()
+        build(doc)
+        value = doc.getvalue()
+        self.assertTrue(value.startswith('<body><div data-length="14"><P>ITEM 0</P>!</div>'))
+        self.assertEqual(value.count('data-length'), 300)
+
+        chunks = []
+        streamed = SimpleDoc(sink = chunks.append, chunk_size = 100)
+        build(streamed)
+        streamed.flush()
+        self.assertEqual(''.join(chunks), value)
+
+        doc = SimpleDoc()
+        try:
+            with doc.tag('div'):
+                with doc.capture(str.upper):
+                    doc.text('discarded')
+                    raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(doc._buffers, [])
+
+    def test_sink(self):
+        def build(doc):
+            tag, text = doc.tag, doc.text
+            with tag('feed', version = '2'):
+                doc.add_class('big')
+                for i in range(2000):
+                    with tag('entry', id = str(i)):
+                        doc.attr(updated = 'today')
+                        with tag('title'):
+                            text('entry & %d' % i)
+                    if i % 500 == 0:
+                        text('\n')
+
+        expected = SimpleDoc()
+        build(expected)
+
+        chunks = []
+        doc = SimpleDoc(sink = chunks.append, chunk_size = 1000)
+        build(doc)
+        self.assertTrue(len(chunks) > 10)
+        self.assertTrue(len(doc.result) < 1000)
+        doc.flush()
+        self.assertEqual(''.join(chunks), expected.getvalue())
+        self.assertEqual(doc.result, [])
+        self.assertRaises(DocError, doc.getvalue)
+
+        fileobj = io.StringIO()
+        doc = SimpleDoc(sink = fileobj)
+        build(doc)
+        doc.flush()
+        self.assertEqual(fileobj.getvalue(), expected.getvalue())
+
+    def test_sink_flat_content(self):
+        def build(doc):
+            with doc.tag('rows', version = '1'):
+                doc.attr(count = '3000')
+                for i in range(1000):
+                    doc.stag('row', id = str(i))
+                    doc.text('<%d>' % i)
+                    doc.asis('<b/>')
+                doc.nl()
+                doc.cdata('x')
+
+        expected = SimpleDoc()
+        build(expected)
+        chunks = []
+        doc = SimpleDoc(sink = chunks.append, chunk_size = 1000)
+        build(doc)
+        self.assertTrue(len(chunks) > 10)
+        self.assertTrue(len(doc.result) < 1000)
+        doc.flush()
+        self.assertEqual(''.join(chunks), expected.getvalue())
+
+        doc = SimpleDoc(compact = True, chunk_size = 1000)
+        with doc.tag('rows'):
+            for i in range(1000):
+                doc.stag('row', id = str(i))
+                doc.text('<%d>' % i)
+            self.assertTrue(len(doc.result) < 300)
+
+        doc = SimpleDoc(sink = io.StringIO())
+        with doc.tag('p'):
+            doc.text('short text')
+            doc.attr(id = 'still-possible')
+            doc.stag('br')
+            self.assertRaises(DocError, doc.attr, klass = 'late')
+
+    def test_sink_frozen_attributes(self):
+        doc = SimpleDoc(sink = io.StringIO())
+        with doc.tag('div'):
+            doc.attr(id = 'main')
+            with doc.tag('p'):
+                pass
+            self.assertRaises(DocError, doc.attr, klass = 'late')
+            self.assertRaises(DocError, doc.add_class, 'late')
+            # no change, no error
+            doc.discard_class('late')
+            doc.toggle_class('late', False)
+        with doc.tag('div', klass = 'a'):
+            with doc.tag('p'):
+                pass
+            doc.add_class('a')
+            doc.toggle_class('a', True)
+            self.assertRaises(DocError, doc.discard_class, 'a')
+
+        sink = io.StringIO()
+        doc = SimpleDoc(sink = sink)
+        li = doc.tag_factory('li')
+        with li:
+            doc.attr(id = 'first')
+            with li:
+                pass
+            self.assertRaises(DocError, doc.attr, klass = 'late')
+        doc.flush()
+        self.assertEqual(sink.getvalue(), '<li id="first"><li></li></li>')
+
+
+class TestDictToAttrs(unittest.TestCase):
+    def test_repeated(self):
+        for i in range(2):
+            self.assertEqual(dict_to_attrs({'class': 'row', 'id': '<1>'}), 'class="row" id="&lt;1>"')
+
+    def test_long_values_not_cached(self):
+        from yattag import simpledoc
+        src = 'data:image/png;base64,' + 'A' * 1000
+        self.assertEqual(dict_to_attrs({'src': src}), 'src="%s"' % src)
+        self.assertNotIn((('src', src),), simpledoc._attrs_cache)
+        dict_to_attrs({'src': 'a.png'})
+        self.assertIn((('src', 'a.png'),), simpledoc._attrs_cache)
+
+    def test_equal_values_of_different_types(self):
+        self.assertEqual(dict_to_attrs({'a': '1'}), 'a="1"')
+        self.assertEqual(dict_to_attrs({'a': 1}), 'a="1"')
+        self.assertEqual(dict_to_attrs({'a': True}), 'a="True"')
+        self.assertEqual(dict_to_attrs({'a': 1.0}), 'a="1.0"')
+        self.assertEqual(dict_to_attrs({'a': AsIs('1')}), 'a=1')
+
 
 class TestFormatAttrValue(unittest.TestCase):
     def test_str(self):
@@ -191,6 +540,73 @@ class TestFormatAttrValue(unittest.TestCase):
         self.assertEqual(format_attr_value(AsIs('\"hello\"')), '\"hello\"')
 
 
+class Markup(str):
+    pass
+
+
+class TestEscape(unittest.TestCase):
+    def test_str(self):
+        self.assertEqual(html_escape('plain'), 'plain')
+        self.assertEqual(html_escape('a < b & c > "d"'), 'a &lt; b &amp; c &gt; "d"')
+        self.assertEqual(attr_escape('a < b & c > "d"'), 'a &lt; b &amp; c > &quot;d&quot;')
+
+    def test_str_subclass(self):
+        for escape, expected in ((html_escape, '&lt;b&gt; &amp;'), (attr_escape, '&lt;b> &amp;')):
+            self.assertEqual(escape(Markup('<b> &')), expected)
+            self.assertEqual(escape(Markup('plain')), 'plain')
+
+    def test_numbers(self):
+        for escape in (html_escape, attr_escape):
+            self.assertEqual(escape(42), '42')
+            self.assertEqual(escape(-4.5), '-4.5')
+            self.assertEqual(escape(True), 'True')
+            self.assertEqual(escape(False), 'False')
+
+    def test_invalid(self):
+        for escape in (html_escape, attr_escape):
+            self.assertRaises(TypeError, escape, None)
+            self.assertRaises(TypeError, escape, ['a'])
+
+
+class TestEscapeMemo(unittest.TestCase):
+    def test_values(self):
+        memo = EscapeMemo(10)
+        for i in range(2):
+            self.assertEqual(memo('a & b'), 'a &amp; b')
+            self.assertEqual(memo(Markup('<i>')), '&lt;i&gt;')
+            self.assertEqual(memo(1), '1')
+            self.assertEqual(memo(True), 'True')
+            self.assertEqual(memo(1.0), '1.0')
+        # only exact strings are stored
+        self.assertEqual(memo.values, {'a & b': 'a &amp; b'})
+        self.assertRaises(TypeError, memo, ['a'])
+
+    def test_eviction(self):
+        memo = EscapeMemo(2)
+        memo('a')
+        memo('b')
+        self.assertEqual(len(memo.values), 2)
+        memo('c')
+        self.assertTrue(len(memo.values) <= 2)
+        self.assertTrue('c' in memo.values)
+        self.assertEqual(memo('a'), 'a')
+
+    def test_max_length(self):
+        memo = EscapeMemo(10)
+        long_value = '<' * (EscapeMemo.max_length + 1)
+        self.assertEqual(memo(long_value), '&lt;' * (EscapeMemo.max_length + 1))
+        self.assertEqual(memo.values, {})
+        short_value = '<' * EscapeMemo.max_length
+        memo(short_value)
+        self.assertEqual(list(memo.values), [short_value])
+
+    def test_document(self):
+        doc = SimpleDoc(escape_memo = 2)
+        for value in ('a', 'b', '<c>', 'a', 1, True):
+            doc.text(value)
+        self.assertEqual(doc.getvalue(), 'ab&lt;c&gt;a1True')
+
+
 
 if __name__ == '__main__':
     unittest.main()
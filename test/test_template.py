@@ -0,0 +1,157 @@
+import unittest
+from yattag import SimpleDoc, Doc, Template, FormTemplate
+from yattag.simpledoc import DocError
+
+
+def product_card(doc, name, price, url):
+    with doc.tag('div', klass = 'card'):
+        with doc.tag('a', href = url, title = name):
+            doc.text(name)
+        doc.line('span', price, klass = 'price')
+        doc.asis('<!-- ', url, ' -->')
+
+
+class TestTemplate(unittest.TestCase):
+
+    def test_render(self):
+        card = Template(product_card, 'name', 'price', 'url')
+        for values in (
+            dict(name = 'Fish & chips', price = 9.5, url = '/fish?a=1&b="2"'),
+            dict(name = '<script>', price = '3', url = ''),
+        ):
+            doc = SimpleDoc()
+            product_card(doc, **values)
+            self.assertEqual(card.render(**values), doc.getvalue())
+
+    def test_append_to(self):
+        card = Template(product_card, 'name', 'price', 'url')
+        doc, tag, text = SimpleDoc().tagtext()
+        with tag('main'):
+            card.append_to(doc, name = 'Tea', price = '2', url = '/tea')
+        self.assertEqual(
+            doc.getvalue(),
+            '<main><div class="card"><a href="/tea" title="Tea">Tea</a>'
+            '<span class="price">2</span><!-- /tea --></div></main>'
+        )
+
+    def test_doc_options(self):
+        def message(doc, content):
+            with doc.tag('p'):
+                doc.text(content)
+                doc.stag('hr')
+
+        template = Template(message, 'content', doc_class = Doc, nl2br = True, stag_end = '>')
+        self.assertEqual(
+            template.render(content = 'a\nb'),
+            '<p>a<br>b<hr></p>'
+        )
+
+    def test_cdata(self):
+        def script(doc, code):
+            with doc.tag('script'):
+                doc.cdata(code)
+            doc.cdata(code, safe = True)
+
+        template = Template(script, 'code')
+        for code in ('x < 1 && y', 'a ]]> b'):
+            doc = SimpleDoc()
+            script(doc, code)
+            self.assertEqual(template.render(code = code), doc.getvalue())
+
+    def test_concatenated_slot(self):
+        def greeting(doc, name):
+            doc.text('Hello ' + name)
+
+        def script(doc, name):
+            doc.cdata('var name = ' + name)
+
+        self.assertRaises(DocError, Template, greeting, 'name')
+        self.assertRaises(DocError, Template, script, 'name')
+
+    def test_bulk_methods(self):
+        def listing(doc, item, label):
+            doc.lines('li', ['first', item])
+            doc.tag_factory('p').line(item)
+            with doc.select(name = 's'):
+                doc.options([('v', label)])
+
+        template = Template(listing, 'item', 'label', doc_class = Doc)
+        values = dict(item = '<script>"', label = 'a > b')
+        doc = Doc()
+        listing(doc, **values)
+        self.assertEqual(template.render(**values), doc.getvalue())
+        self.assertTrue('<li>&lt;script&gt;"</li>' in template.render(**values))
+
+
+def checkout_form(doc):
+    doc.detached_errors()
+    with doc.tag('form', action = '/checkout'):
+        doc.input(name = 'email', type = 'email', klass = 'wide')
+        doc.input(name = 'attachment', type = 'file')
+        for color in ('red', 'blue'):
+            doc.input(('data-color', color), name = 'color', type = 'radio', value = color)
+        for extra in ('gift-wrap', 'fast-shipping'):
+            doc.input(name = 'extras', type = 'checkbox', value = extra)
+        with doc.textarea(name = 'message', rows = '3'):
+            doc.text('Your message')
+        with doc.select(name = 'sizes', multiple = 'multiple', klass = 'big'):
+            for size in ('S', 'M', 'L'):
+                with doc.option(value = size, title = 'Size ' + size):
+                    doc.text(size)
+        doc.stag('input', type = 'submit', value = 'Buy')
+
+
+class TestFormTemplate(unittest.TestCase):
+
+    def test_render(self):
+        form = FormTemplate(checkout_form, stag_end = '>')
+        for defaults, errors in (
+            ({}, {}),
+            (
+                {'email': 'a"b@example.com', 'color': 'blue', 'extras': ['gift-wrap'],
+                 'message': '<hi>', 'sizes': ['S', 'L']},
+                {}
+            ),
+            (
+                {'color': 'red', 'extras': ('fast-shipping', 'gift-wrap'), 'sizes': 'M'},
+                {'email': 'Invalid & wrong', 'color': 'Pick one', 'extras': 'No',
+                 'message': 'Too long', 'sizes': 'Out of stock', 'coupon': 'Expired'}
+            ),
+        ):
+            doc = Doc(defaults = defaults, errors = errors, stag_end = '>')
+            checkout_form(doc)
+            self.assertEqual(form.render(defaults, errors), doc.getvalue())
+
+            doc = Doc(defaults = defaults, errors = errors, stag_end = '>')
+            doc.detached_errors()
+            form.append_to(doc)
+            other = Doc(defaults = defaults, errors = errors, stag_end = '>')
+            other.detached_errors()
+            checkout_form(other)
+            self.assertEqual(doc.getvalue(), other.getvalue())
+
+    def test_numeric_defaults(self):
+        def form(doc):
+            for i in (1, 2):
+                doc.input('ids', type = 'checkbox', value = str(i))
+            with doc.select(name = 's', multiple = 'multiple'):
+                for i in (1, 2):
+                    with doc.option(value = str(i)):
+                        doc.text(str(i))
+        defaults = {'ids': [1], 's': [2]}
+        doc = Doc(defaults = defaults)
+        form(doc)
+        self.assertEqual(doc.getvalue().count('checked="checked"'), 1)
+        self.assertEqual(doc.getvalue().count('selected="selected"'), 1)
+        self.assertEqual(FormTemplate(form).render(defaults), doc.getvalue())
+        doc = Doc(defaults = defaults)
+        FormTemplate(form).append_to(doc)
+        self.assertEqual(doc.getvalue().count('checked="checked"'), 1)
+
+    def test_file_default(self):
+        form = FormTemplate(checkout_form)
+        self.assertRaises(DocError, form.render, {'attachment': 'x'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -58,8 +58,11 @@ __author__ = "Benjamin Le Forestier (benjamin@leforestier.org)"
 __version__ = '1.16.1'
 __all__ = [
     'Doc',
+    'OptionList',
     'SimpleDoc',
     'AsIs',
+    'Template',
+    'FormTemplate',
     'indent',
     'NO',
     'FIRST_LINE',
@@ -67,5 +70,6 @@ __all__ = [
 ]
 
 from yattag.simpledoc import SimpleDoc, AsIs
-from yattag.doc import Doc
+from yattag.doc import Doc, OptionList
+from yattag.template import Template, FormTemplate
 from yattag.indentation import indent, NO, FIRST_LINE, EACH_LINE
@@ -0,0 +1,118 @@
+"""
+Asynchronous rendering of yattag documents.
+
+`render_async` turns a render function into an asynchronous iterator of
+encoded chunks, suitable as the body of a streaming response in an async web
+framework. The document is streamed (see the `sink` argument of SimpleDoc)
+so the first chunks are available before the whole page is generated.
+
+Example with an ASGI application::
+
+    from yattag.aio import render_async
+
+    def page(doc):
+        tag, text = doc.tag, doc.text
+        with tag('table'):
+            for row in rows:
+                with tag('tr'):
+                    with tag('td'):
+                        text(row)
+                yield # the event loop may run other tasks here
+
+    async def app(scope, receive, send):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/html; charset=utf-8')]
+        })
+        async for chunk in render_async(page):
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+"""
+
+import asyncio
+import codecs
+import inspect
+from typing import Any
+from typing import AsyncIterator
+from typing import List
+
+from yattag.simpledoc import SimpleDoc
+
+__all__ = ['render_async']
+
+async def render_async(render_function, doc_class = SimpleDoc, encoding = 'utf-8',
+ chunk_size = 16384, yield_every = 64, **doc_kwargs):
+    # type: (Any, Any, str, int, int, Any) -> AsyncIterator[bytes]
+    """
+    renders a document and returns an asynchronous iterator over its encoded chunks
+
+    render_function:
+        a function taking the document as its only argument and building it.
+        If it is a generator function, each `yield` statement inside of it marks
+        a point where the rendering can be suspended: the finished part of the
+        document is then handed over to the consumer as soon as it reaches
+        `chunk_size` characters, and control is given back to the event loop
+        every `yield_every` suspension points.
+        A plain function is run in one go (the output is still delivered chunk by chunk).
+        Coroutine functions (`async def`) are awaited the same way, and
+        asynchronous generator functions are suspended at each `yield` like
+        generator functions, and may also `await` inside of them.
+
+    doc_class:
+        the class of the document to render (SimpleDoc or Doc, or a subclass).
+        Additional keyword arguments are passed to its constructor.
+        Defaults to SimpleDoc.
+
+    encoding:
+        the encoding of the produced chunks. Defaults to 'utf-8'.
+
+    Rendering only progresses when the consumer asks for the next chunk,
+    so a slow client naturally slows down the rendering. If the consumer
+    stops iterating (for example because the client disconnected and the task
+    got cancelled), the render function is closed: the `with` blocks it was
+    in are exited and no further rendering happens.
+    """
+    chunks = [] # type: List[str]
+    encode = codecs.getincrementalencoder(encoding)().encode
+    doc = doc_class(sink = chunks.append, chunk_size = chunk_size, **doc_kwargs)
+    steps = render_function(doc)
+    points = _suspension_points(steps)
+    try:
+        pauses = 0
+        async for _ in points:
+            doc._flush()
+            if chunks:
+                pauses = 0
+                while chunks:
+                    yield encode(chunks.pop(0))
+            else:
+                pauses += 1
+                if pauses >= yield_every:
+                    pauses = 0
+                    await asyncio.sleep(0)
+        doc.flush()
+        chunks.append('')
+        while chunks:
+            chunk = encode(chunks.pop(0), not chunks)
+            if chunk:
+                yield chunk
+    finally:
+        await points.aclose()
+        if inspect.isgenerator(steps) or inspect.iscoroutine(steps):
+            steps.close()
+        elif inspect.isasyncgen(steps):
+            await steps.aclose()
+
+async def _suspension_points(steps):
+    # type: (Any) -> AsyncIterator[None]
+    # iterates over the points where the rendering can be suspended,
+    # whatever the kind of the render function
+    if inspect.isgenerator(steps):
+        for _ in steps:
+            yield
+    elif inspect.isasyncgen(steps):
+        async for _ in steps:
+            yield
+    elif inspect.iscoroutine(steps):
+        await steps
@@ -0,0 +1,123 @@
+"""
+A bounded in-process cache, used to store rendered fragments of documents
+(see the `cached` method of SimpleDoc) and indented documents (see the
+`cache` argument of yattag.indent).
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Hashable
+from typing import Optional
+from typing import Tuple
+
+__all__ = ['LRUCache']
+
+class LRUCache(object):
+    """
+    dictionary-like cache holding at most `maxsize` entries and, if `maxbytes`
+    is set, values of at most `maxbytes` bytes in total (as measured by the
+    `sizeof` function, sys.getsizeof by default).
+    When it's full, the least recently used entries are evicted.
+    A value larger than `maxbytes` on its own isn't stored.
+    Entries can also be given a time to live (in seconds).
+
+    The `hits`, `misses` and `evictions` counters, also available as a dictionary
+    through the `stats` method, help choosing a suitable size.
+
+    An LRUCache can be shared between threads.
+    """
+
+    def __init__(self, maxsize = 1024, maxbytes = None, sizeof = sys.getsizeof):
+        # type: (int, Optional[int], Callable[[Any], int]) -> None
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self._entries = OrderedDict() # type: OrderedDict[Hashable, Tuple[Any, Optional[float], int]]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default = None):
+        # type: (Hashable, Any) -> Any
+        """
+        returns the value stored for `key`, or `default` if there's no such value
+        or if it expired
+        """
+        with self._lock:
+            try:
+                value, expires, nbytes = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires <= time.monotonic():
+                del self._entries[key]
+                self.nbytes -= nbytes
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl = None):
+        # type: (Hashable, Any, Optional[float]) -> None
+        """
+        stores `value` for `key`. If `ttl` is set, the value expires after
+        `ttl` seconds.
+        """
+        expires = None if ttl is None else time.monotonic() + ttl
+        nbytes = self.sizeof(value)
+        with self._lock:
+            self._discard(key)
+            if self.maxbytes is not None and nbytes > self.maxbytes:
+                return
+            self._entries[key] = (value, expires, nbytes)
+            self.nbytes += nbytes
+            while len(self._entries) > self.maxsize or (
+                self.maxbytes is not None and self.nbytes > self.maxbytes
+            ):
+                self.nbytes -= self._entries.popitem(last = False)[1][2]
+                self.evictions += 1
+
+    def discard(self, key):
+        # type: (Hashable) -> None
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key):
+        # type: (Hashable) -> None
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[2]
+
+    def clear(self):
+        # type: () -> None
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._entries)
+
+    def stats(self):
+        # type: () -> Dict[str, int]
+        """
+        returns a dictionary with the number of hits, misses, evictions,
+        the current number of entries and the size of the values in bytes
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'bytes': self.nbytes,
+            'maxbytes': self.maxbytes,
+        }
@@ -13,7 +13,7 @@ try:
 except NameError:
     pass
 
-__all__ = ['Doc']
+__all__ = ['Doc', 'OptionList']
 
 class SimpleInput(object):
 
@@ -67,7 +67,7 @@ class CheckableInput(object):
         # type: (Any, Union[str, int, float]) -> bool
         if isinstance(default, str):
             return value == default
-        elif isinstance(default, (tuple, list, set)):
+        elif isinstance(default, (tuple, list, set, frozenset)):
             return value in default
         return False
      
@@ -182,18 +182,19 @@ class Option(object):
         self.value = value
         self.attrs = attrs
 
-    def render(self, defaults, errors, inner_content):
-        # type: (Dict[str, str | List[str] | bool], Dict[str, str], str) -> str
-        selected = False        
+    def selected(self, defaults):
+        # type: (Dict[str, str | List[str] | bool]) -> bool
         if self.name in defaults:
             if self.multiple:
-                if self.value in defaults[self.name]:
-                    selected = True
+                return self.value in defaults[self.name]
             else:
-                if self.value == defaults[self.name]:
-                    selected = True
+                return self.value == defaults[self.name]
+        return False
+
+    def render(self, defaults, errors, inner_content):
+        # type: (Dict[str, str | List[str] | bool], Dict[str, str], str) -> str
         lst = ['<option value="', attr_escape(self.value), '"']
-        if selected:
+        if self.selected(defaults):
             lst.append(' selected="selected"')
         if self.attrs:
             lst.append(' ')
@@ -202,7 +203,170 @@ class Option(object):
         lst.append(inner_content)
         lst.append('</option>')
         return ''.join(lst)
-        
+
+
+def _normalize_value(value):
+    # type: (Any) -> Any
+    # numbers and their string representation are the same form value
+    if type(value) is str:
+        return value
+    if isinstance(value, (int, float)):
+        return str(value)
+    return value
+
+class DefaultSet(frozenset):
+    """
+    frozen set of the default values of a field (a group of checkboxes or
+    a multiple select). Membership tests are O(1) and numbers match their
+    string representation: `1 in DefaultSet(['1'])` is True.
+    """
+    __slots__ = ()
+
+    def __new__(cls, values):
+        # type: (Any) -> DefaultSet
+        return frozenset.__new__(cls, (_normalize_value(value) for value in values))
+
+    def __contains__(self, value):
+        # type: (Any) -> bool
+        try:
+            return frozenset.__contains__(self, _normalize_value(value))
+        except TypeError:
+            return False
+
+class IndexedDefaults(object):
+    """
+    read-only view of a defaults dictionary in which lists, tuples and sets
+    of values are replaced with DefaultSet instances.
+    The sets are built the first time a field is looked up, and built again
+    if the value of the field is replaced in the underlying dictionary
+    (but not if a list is modified in place).
+    """
+    __slots__ = ('defaults', '_sets')
+
+    def __init__(self, defaults):
+        # type: (Dict[str, Any]) -> None
+        self.defaults = defaults
+        self._sets = {} # type: Dict[str, Tuple[Any, DefaultSet]]
+
+    def __contains__(self, name):
+        # type: (str) -> bool
+        return name in self.defaults
+
+    def __getitem__(self, name):
+        # type: (str) -> Any
+        value = self.defaults[name]
+        if not isinstance(value, (list, tuple, set, frozenset)):
+            return value
+        try:
+            source, values = self._sets[name]
+            if source is value:
+                return values
+        except KeyError:
+            pass
+        try:
+            values = DefaultSet(value)
+        except TypeError: # unhashable values, keep the original collection
+            return value
+        self._sets[name] = (value, values)
+        return values
+
+    def get(self, name, default = None):
+        # type: (str, Any) -> Any
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+class OptionList(object):
+    """
+    list of <option> elements rendered once and reused by any number of
+    documents, for option lists that don't change between requests
+    (countries, currencies, time zones...).
+
+    `items` and the additional attributes are the same as for the `options`
+    method of Doc. When the list is added to a select element with
+    `doc.options(option_list)`, the ` selected="selected"` attributes are
+    inserted into the cached html at offsets recorded when rendering it,
+    so the cost of each use depends on the number of selected options,
+    not on the length of the list.
+
+    Example::
+
+        CURRENCIES = OptionList([('EUR', 'Euro'), ('USD', 'US Dollar')])
+
+        with doc.select(name = 'currency'):
+            doc.options(CURRENCIES)
+
+    The labels are escaped with html_escape, independently of the text
+    filters of the documents the list is used in.
+    """
+
+    def __init__(self, items, *args, **kwargs):
+        # type: (Any, Any, Union[str, int, float]) -> None
+        (attrs,) = _attrs_from_args((), *args, **kwargs)
+        self.items = [item if isinstance(item, tuple) else (item, item) for item in items]
+        self.attrs = attrs
+        end_of_tag = (' %s>' % dict_to_attrs(attrs)) if attrs else '>'
+        parts = [] # type: List[str]
+        length = 0
+        # normalized value -> [(offset of the selected attribute, value), ...]
+        offsets = {} # type: Dict[Any, List[Tuple[int, Any]]]
+        for value, label in self.items:
+            start = '<option value="%s"' % attr_escape(value)
+            end = '%s%s</option>' % (end_of_tag, html_escape(label))
+            length += len(start)
+            offsets.setdefault(_normalize_value(value), []).append((length, value))
+            length += len(end)
+            parts.append(start)
+            parts.append(end)
+        self.html = ''.join(parts)
+        self._offsets = offsets
+
+    def selected_offsets(self, default, multiple):
+        # type: (Any, bool) -> List[int]
+        """
+        returns the sorted offsets at which ` selected="selected"` must be
+        inserted, given the default value of the select element
+        """
+        offsets = self._offsets
+        if not multiple:
+            try:
+                entries = offsets.get(_normalize_value(default), ())
+            except TypeError:
+                return []
+            return [offset for offset, value in entries if value == default]
+        if isinstance(default, DefaultSet):
+            if len(default) < len(offsets):
+                return sorted(
+                    offset for value in default for offset, _ in offsets.get(value, ())
+                )
+            return sorted(
+                offset for value, entries in offsets.items() if value in default
+                for offset, _ in entries
+            )
+        return sorted(
+            offset for entries in offsets.values()
+            for offset, value in entries if value in default
+        )
+
+    def render(self, name, multiple, defaults):
+        # type: (str, bool, Any) -> str
+        try:
+            default = defaults[name]
+        except KeyError:
+            return self.html
+        html = self.html
+        parts = []
+        start = 0
+        for offset in self.selected_offsets(default, multiple):
+            parts.append(html[start:offset])
+            parts.append(' selected="selected"')
+            start = offset
+        if not parts:
+            return html
+        parts.append(html[start:])
+        return ''.join(parts)
+
 def _attrs_from_args(required_keys, *args, **kwargs):
     # type: (Any, Any, Union[str, int, float]) -> List[Any]
     # need to do all this to allow specifying attributes as (key, value) pairs
@@ -260,7 +424,9 @@ class Doc(SimpleDoc):
     Select = Select
     Option = Option
     
-    class TextareaTag(object):
+    class TextareaTag(SimpleDoc.CapturingTag):
+        __slots__ = ('name', 'attrs')
+
         def __init__(self, doc, name, attrs):
             # type: (Doc, str, Dict[str, Union[str, int, float]]) -> None
             # name is the name attribute of the textarea, ex: 'contact_message'
@@ -268,30 +434,20 @@ class Doc(SimpleDoc):
             self.doc = doc
             self.name = name
             self.attrs = attrs
-        
-        def __enter__(self):
-            # type: () -> None
-            self.parent_tag = self.doc.current_tag
-            self.doc.current_tag = self
-            self.position = len(self.doc.result)
-            self.doc._append('')
-            
-        def __exit__(self, tpe, value, traceback):
-            # type: (Any, Any, Any) -> None
-            if value is None:
-                inner_content = ''.join(self.doc.result[self.position+1:])
-                del self.doc.result[self.position+1:]              
-                rendered_textarea = self.doc.__class__.Textarea(self.name, self.attrs).render(
-                    defaults = self.doc.defaults,
-                    errors = self.doc.errors,
-                    inner_content = inner_content,
-                    error_wrapper = self.doc.error_wrapper
-                )
-                self.doc.result[self.position] = rendered_textarea
-                self.doc.current_tag = self.parent_tag
-                
-    
-    class SelectTag(object):
+
+        def render(self, inner_content):
+            # type: (str) -> str
+            return self.doc.__class__.Textarea(self.name, self.attrs).render(
+                defaults = self.doc.defaults,
+                errors = self.doc.errors,
+                inner_content = inner_content,
+                error_wrapper = self.doc.error_wrapper
+            )
+
+
+    class SelectTag(SimpleDoc.CapturingTag):
+        __slots__ = ('name', 'attrs', 'multiple', 'old_current_select')
+
         def __init__(self, doc, name, attrs):
             # type: (Doc, str, Dict[str, Union[str, int, float]]) -> None
             # name is the name attribute of the select, ex: 'color'
@@ -301,33 +457,31 @@ class Doc(SimpleDoc):
             self.attrs = attrs
             self.multiple = bool(attrs.get('multiple'))
             self.old_current_select = None
-                
+
         def __enter__(self):
             # type: () -> None
-            self.parent_tag = self.doc.current_tag
-            self.doc.current_tag = self
-            self.position = len(self.doc.result)
-            self.doc._append('')
+            super(Doc.SelectTag, self).__enter__()
             self.old_current_select = self.doc.current_select
             self.doc.current_select = self
-            
+
         def __exit__(self, tpe, value, traceback):
             # type: (Any, Any, Any) -> None
-            if value is None:
-                inner_content = ''.join(self.doc.result[self.position+1:])
-                del self.doc.result[self.position+1:]
-                rendered_select = self.doc.__class__.Select(self.name, self.attrs).render(
-                    defaults = {},  # no defaults for the <select> tag. Defaults are handled by the <option> tags directly.
-                    errors = self.doc.errors,
-                    inner_content = inner_content,
-                    error_wrapper = self.doc.error_wrapper
-                )
-                self.doc.result[self.position] = rendered_select
-                self.doc.current_tag = self.parent_tag  
-                self.doc.current_select = self.old_current_select
-                
+            self.doc.current_select = self.old_current_select
+            super(Doc.SelectTag, self).__exit__(tpe, value, traceback)
+
+        def render(self, inner_content):
+            # type: (str) -> str
+            return self.doc.__class__.Select(self.name, self.attrs).render(
+                defaults = {},  # no defaults for the <select> tag. Defaults are handled by the <option> tags directly.
+                errors = self.doc.errors,
+                inner_content = inner_content,
+                error_wrapper = self.doc.error_wrapper
+            )
+
+
+    class OptionTag(SimpleDoc.CapturingTag):
+        __slots__ = ('select', 'attrs', 'value')
 
-    class OptionTag(object):
         def __init__(self, doc, select, value, attrs):
             # type: (Doc, Doc.SelectTag, str, Dict[str, Union[str, int, float]]) -> None
             self.doc = doc
@@ -335,31 +489,20 @@ class Doc(SimpleDoc):
             self.attrs = attrs
             self.value = value
 
-        def __enter__(self):
-            # type: () -> None
-            self.parent_tag = self.doc.current_tag
-            self.doc.current_tag = self
-            self.position = len(self.doc.result)
-            self.doc._append('')
-            
-        def __exit__(self, tpe, value, traceback):
-            # type: (Any, Any, Any) -> None
-            if value is None:
-                inner_content = ''.join(self.doc.result[self.position+1:])
-                del self.doc.result[self.position+1:]
-                self.doc.result[self.position] = self.doc.__class__.Option(
-                    name = self.select.name,
-                    multiple = self.select.multiple,
-                    value = self.value,
-                    attrs = self.attrs
-                ).render(
-                    defaults = self.doc.defaults,
-                    errors = self.doc.errors,
-                    inner_content = inner_content
-                )
-                self.doc.current_tag = self.parent_tag
+        def render(self, inner_content):
+            # type: (str) -> str
+            return self.doc.__class__.Option(
+                name = self.select.name,
+                multiple = self.select.multiple,
+                value = self.value,
+                attrs = self.attrs
+            ).render(
+                defaults = self.doc._indexed_defaults(),
+                errors = self.doc.errors,
+                inner_content = inner_content
+            )
+
 
-    
     def __init__(self, defaults = None, errors = None,
      error_wrapper = ('<span class="error">', '</span>'), *args, **kwargs):
         # type: (Optional[Dict[str, str | List[str] | bool]], Optional[Dict[str, str]], Tuple[str, str], Any, Any) -> None
@@ -407,7 +550,18 @@ class Doc(SimpleDoc):
         self.checkbox_group_class = groupclass(self.__class__.CheckboxInput)
         self._fields = set() # type: Set[Any]
         self._detached_errors_pos = [] # type: List[Any]
-    
+        self._detached_errors_state = None # type: Any
+        self._defaults_index = None # type: Optional[IndexedDefaults]
+
+    def _indexed_defaults(self):
+        # type: () -> IndexedDefaults
+        # used by checkboxes, radio buttons and options, which only test
+        # membership, so that large groups don't scan the default values
+        # over and over again
+        index = self._defaults_index
+        if index is None or index.defaults is not self.defaults:
+            index = self._defaults_index = IndexedDefaults(self.defaults)
+        return index
      
     def input(self, *args, **kwargs):
         # type: (Any, Union[str, int, float]) -> None
@@ -424,6 +578,8 @@ class Doc(SimpleDoc):
                     self.defaults, self.errors, self.error_wrapper, self._stag_end
                 )
             )
+            if self._flushing:
+                self._flush()
             return
         if type == 'radio':
             if name not in self.radios:
@@ -439,7 +595,11 @@ class Doc(SimpleDoc):
             else:
                 raise DocError("Unknown input type: %s" % type)
         
-        self._append(checkable_group.input(attrs).render(self.defaults, self.errors, self.error_wrapper, self._stag_end))
+        self._append(checkable_group.input(attrs).render(
+            self._indexed_defaults(), self.errors, self.error_wrapper, self._stag_end
+        ))
+        if self._flushing:
+            self._flush()
         
     def textarea(self, *args, **kwargs):
         # type: (Any, Union[str, int, float]) -> Doc.TextareaTag
@@ -463,9 +623,79 @@ class Doc(SimpleDoc):
             return self.__class__.OptionTag(self, self.current_select, value, attrs)
         else:
             raise DocError("No <select> tag opened. Can't put an <option> here.")
-            
+
+    def options(self, items, *args, **kwargs):
+        # type: (Any, Any, Union[str, int, float]) -> None
+        """
+        appends an <option> element to the current <select> for each element
+        of `items`, which are either values, used as labels too, or
+        (value, label) tuples. Additional attributes, shared by all the options,
+        can be passed as (key, value) pairs or as keyword arguments.
+
+        `items` can also be an OptionList, whose cached html is then used.
+
+        Example::
+
+            with doc.select(name = 'currency'):
+                doc.options([('EUR', 'Euro'), ('USD', 'US Dollar')])
+        """
+        select = self.current_select
+        if not select:
+            raise DocError("No <select> tag opened. Can't put an <option> here.")
+        defaults = self._indexed_defaults()
+        option_class = self.__class__.Option
+        if isinstance(items, OptionList):
+            if args or kwargs:
+                raise DocError("The attributes of an OptionList are given to its constructor.")
+            if option_class is Option:
+                self._append(items.render(select.name, select.multiple, defaults))
+                return
+            items, attrs = items.items, items.attrs
+        else:
+            (attrs,) = _attrs_from_args((), *args, **kwargs)
+        escape = self._escape
+        if option_class is not Option:
+            # customized options are rendered one by one
+            for item in items:
+                value, label = item if isinstance(item, tuple) else (item, item)
+                self._append(option_class(select.name, select.multiple, value, attrs).render(
+                    defaults = defaults,
+                    errors = self.errors,
+                    inner_content = escape(label)
+                ))
+            return
+        end_of_tag = (' %s>' % dict_to_attrs(attrs)) if attrs else '>'
+        try:
+            default = defaults[select.name]
+        except KeyError:
+            has_default = False
+        else:
+            has_default = True
+        multiple = select.multiple
+        append = self._append
+        for item in items:
+            value, label = item if isinstance(item, tuple) else (item, item)
+            if has_default and (value in default if multiple else value == default):
+                append('<option value="%s" selected="selected"%s%s</option>' % (
+                    attr_escape(value), end_of_tag, escape(label)
+                ))
+            else:
+                append('<option value="%s"%s%s</option>' % (
+                    attr_escape(value), end_of_tag, escape(label)
+                ))
+
     def detached_errors(self, render_function = None):
         # type: (Any) -> None
+        if self._sink is not None:
+            raise DocError(
+                "Detached errors are rendered when calling getvalue, "
+                "they can't be used in a streamed document."
+            )
+        if self._buffers:
+            raise DocError(
+                "Detached errors can't be used inside of a cached fragment or a capture "
+                "(the rendered errors depend on the whole document)."
+            )
         self._detached_errors_pos.append((len(self.result), render_function or self.error_dict_to_string))
         self.result.append('')
         
@@ -482,16 +712,31 @@ class Doc(SimpleDoc):
             return ''
                         
             
-    def getvalue(self):
-        # type: () -> str
-        """
-        returns the whole document as a string
-        """
-        for position, render_function in self._detached_errors_pos:
-            self.result[position] = render_function(
-                dict((name, self.errors[name]) for name in self.errors if name not in self._fields)
-            )
-        return ''.join(self.result)
+    def _prepare_output(self):
+        # type: () -> None
+        # also renders the detached errors in their slots
+        super(Doc, self)._prepare_output()
+        errors = list(self.errors.items())
+        state = (errors, len(self._fields), len(self._detached_errors_pos))
+        if self._detached_errors_pos and state != self._detached_errors_state:
+            detached = dict((name, error) for name, error in errors if name not in self._fields)
+            for position, render_function in self._detached_errors_pos:
+                self.result[position] = render_function(detached)
+            self._detached_errors_state = state
+
+    def _pinned_positions(self):
+        # type: () -> List[int]
+        return super(Doc, self)._pinned_positions() + [
+            position for position, _ in self._detached_errors_pos
+        ]
+
+    def _move_positions(self, moves):
+        # type: (Dict[int, int]) -> None
+        super(Doc, self)._move_positions(moves)
+        self._detached_errors_pos = [
+            (moves.get(position, position), render_function)
+            for position, render_function in self._detached_errors_pos
+        ]
 
 def _add_class(dct, klass):
     # type: (Dict[str, Any], str) -> None
@@ -1,8 +1,23 @@
+import argparse
+import array
+import bisect
+import codecs
+import glob
+import hashlib
+import itertools
+import mmap
+import multiprocessing
+import os
 import re
+import shutil
+import sys
+import tempfile
 from typing import Any
 from typing import Dict
+from typing import Iterable
+from typing import Iterator
 from typing import List
-from typing import Set
+from typing import Optional
 from typing import Tuple
 from typing import Union
 
@@ -13,7 +28,7 @@ NO = False
 FIRST_LINE = True
 EACH_LINE = 2
 
-__all__ = ['indent', 'NO', 'FIRST_LINE', 'EACH_LINE']
+__all__ = ['indent', 'indent_stream', 'indent_many', 'indent_parallel', 'NO', 'FIRST_LINE', 'EACH_LINE']
 
 class TokenMeta(type):
 
@@ -35,18 +50,41 @@ TokenBase = TokenMeta('TokenBase', (object,), {}) # type: Any
 
 class Token(TokenBase): # type: ignore
     regex = None # type: Union[None, str]
+    # characters that can follow the '<' (and optional spaces) at the start
+    # of the token, None if not restricted
+    first_chars = None # type: Union[None, str]
+
+    # If not None, a class method `scan(string, start)` returning the token
+    # starting at `start`, or None. Used instead of the regex by the tokenizer.
+    scan = None # type: Any
 
     def __init__(self, groupdict):
-        # type: (Dict[str, Any]) -> None
+        # type: (Any) -> None
+        # groupdict: anything supporting `groupdict[group_name]`, usually the match object
         self.content = groupdict[self.__class__.__name__]
 
+    @classmethod
+    def from_content(cls, content):
+        # type: (str) -> Any
+        token = cls.__new__(cls)
+        token.content = content
+        return token
+
 class Text(Token):
     regex = '[^<>]+'
     def __init__(self, *args, **kwargs):
-        # type: (Dict[str, Any], Any) -> None
+        # type: (Any, Any) -> None
         super(Text, self).__init__(*args, **kwargs)
         self._isblank = None # type: Union[None, bool]
 
+    @classmethod
+    def from_content(cls, content):
+        # type: (str) -> Text
+        token = cls.__new__(cls)
+        token.content = content
+        token._isblank = None
+        return token
+
     @property
     def isblank(self):
         # type: () -> bool
@@ -54,13 +92,79 @@ class Text(Token):
             self._isblank = not self.content.strip()
         return self._isblank
 
-class Comment(Token):
+def _flags(regex):
+    # type: (str) -> Any
+    return re.compile(regex, re.X | re.I | re.S)
+
+class RawContentToken(Token):
+    """
+    token made of a start, a raw content and an end, like comments and
+    scripts. Instead of the regex, which tests at each character of the content
+    whether the end is reached, the tokenizer uses the `scan` method: the start
+    is matched with `start_regex` and the first match of `end_regex` after it
+    ends the token, as with the regex. Recognizing the token takes linear time.
+    """
+    start_regex = None # type: Any
+    end_regex = None # type: Any
+    # whether the regex can parse the start differently if the end isn't found
+    # (in that rare case, the decision is left to the regex)
+    ambiguous_start = False
+
+    @classmethod
+    def scan(cls, string, start):
+        # type: (str, int) -> Any
+        mobj = cls._match_start(string, start)
+        if mobj is None:
+            return None
+        end = cls._search_end(string, mobj.end())
+        if end is None:
+            if not cls.ambiguous_start:
+                return None
+            mobj = cls._match(string, start)
+            if mobj is None:
+                return None
+            return cls.from_content(mobj.group())
+        return cls.from_content(string[start:end.end()])
+
+    @classmethod
+    def _match_start(cls, string, start):
+        # type: (str, int) -> Any
+        cls._compile()
+        return cls._match_start(string, start)
+
+    @classmethod
+    def _search_end(cls, string, start):
+        # type: (str, int) -> Any
+        cls._compile()
+        return cls._search_end(string, start)
+
+    @classmethod
+    def _match(cls, string, start):
+        # type: (str, int) -> Any
+        cls._compile()
+        return cls._match(string, start)
+
+    @classmethod
+    def _compile(cls):
+        # type: () -> None
+        cls._match_start = staticmethod(_flags(cls.start_regex).match) # type: ignore
+        cls._search_end = staticmethod(_flags(cls.end_regex).search) # type: ignore
+        cls._match = staticmethod(_flags(cls.regex).match) # type: ignore
+
+class Comment(RawContentToken):
     regex = r'<!--((?!-->).)*.?-->'
+    first_chars = '!'
+    start_regex = r'<!--'
+    end_regex = r'-->'
 
-class CData(Token):
+class CData(RawContentToken):
     regex = r'<!\[CDATA\[(.*?)\]\]>'
+    first_chars = '!'
+    start_regex = r'<!\[CDATA\['
+    end_regex = r'\]\]>'
 
 class Doctype(Token):
+    first_chars = '!'
     regex = r'''<!DOCTYPE(\s+([^<>"']+|"[^"]*"|'[^']*'))*>'''
 
 _open_tag_start = r'''
@@ -77,7 +181,8 @@ _open_tag_start = r'''
         )*
     \s*'''
 
-class Script(Token):
+class Script(RawContentToken):
+    first_chars = 'sS\u017f' # the long s matches 's' when ignoring case
     _end_script = r'<\s*/\s*script\s*>'
 
     regex = _open_tag_start.format(
@@ -86,8 +191,15 @@ class Script(Token):
     ) + r'>((?!({end_script})).)*.?{end_script}'.format(
         end_script = _end_script
     )
+    start_regex = _open_tag_start.format(
+        tag_name_key = 'script_ignore',
+        tag_name_rgx = 'script',
+    ) + '>'
+    end_regex = _end_script
+    ambiguous_start = True
 
-class Style(Token):
+class Style(RawContentToken):
+    first_chars = 'sS\u017f'
     _end_style = r'<\s*/\s*style\s*>'
 
     regex = _open_tag_start.format(
@@ -96,14 +208,22 @@ class Style(Token):
     ) + r'>((?!({end_style})).)*.?{end_style}'.format(
         end_style = _end_style
     )
+    start_regex = _open_tag_start.format(
+        tag_name_key = 'style_ignore',
+        tag_name_rgx = 'style',
+    ) + '>'
+    end_regex = _end_style
+    ambiguous_start = True
 
 class XMLDeclaration(Token):
+    first_chars = '?'
     regex = _open_tag_start.format(
         tag_name_key = 'xmldecl_ignore',
         tag_name_rgx = r'\?\s*xml'
     ) + r'\?\s*>'
 
 class XMLProcessingInstruction(Token):
+    first_chars = '?'
     regex = r'<\?(?!xml\s)[^?/><"\s]+(\s[^?>]*)?\?>'
 
 class NamedTagTokenMeta(TokenMeta):
@@ -138,122 +258,431 @@ class SelfTag(NamedTagToken): # a self closing tag
     regex_template = _open_tag_start + r'/\s*>'
 
 class CloseTag(NamedTagToken):
+    first_chars = '/'
     regex_template = r'<\s*/(?P<{tag_name_key}>{tag_name_rgx})(\s[^/><"]*)?>'
 
 class XMLTokenError(Exception):
         pass
 
 class Tokenizer(object):
+    """
+    splits a string into tokens of the given classes. When several classes
+    match at the same position, the first one in `token_classes` wins.
+    """
+
+    _text_end = re.compile('[<>]').search
 
     def __init__(self, token_classes):
         # type: (Tuple[Any, ...]) -> None
         self.token_classes = token_classes
         self.token_names = [kls.__name__ for kls in token_classes]
         self.get_token = None # type: Any
-
-    def _compile_regex(self):
-        # type: () -> None
-        self.get_token = re.compile(
+        # character following '<' -> match function of the tokens that can start with it
+        self._get_token_by_char = {} # type: Dict[str, Any]
+        self._get_token_by_classes = {} # type: Dict[Tuple[Any, ...], Any]
+        self._raw_classes = [] # type: List[Any]
+        self._raw_first_chars = None # type: Any
+
+    @staticmethod
+    def _compile(token_classes):
+        # type: (Tuple[Any, ...]) -> Any
+        # returns a function taking the string and a position, and returning
+        # the token of the first class in `token_classes` matching there, or None
+        steps = [] # type: List[Any]
+        regex_classes = [] # type: List[Any]
+        for klass in token_classes + (None,):
+            if klass is not None and klass.scan is None:
+                regex_classes.append(klass)
+                continue
+            if regex_classes:
+                steps.append(Tokenizer._compile_regex_step(tuple(regex_classes)))
+                regex_classes = []
+            if klass is not None:
+                steps.append(klass.scan)
+        if not steps:
+            return lambda string, start: None
+        if len(steps) == 1:
+            return steps[0]
+        def get_token(string, start):
+            # type: (str, int) -> Any
+            for step in steps:
+                token = step(string, start)
+                if token is not None:
+                    return token
+            return None
+        return get_token
+
+    @staticmethod
+    def _compile_regex_step(token_classes):
+        # type: (Tuple[Any, ...]) -> Any
+        match = re.compile(
             '|'.join(
-                '(?P<%s>%s)' % (klass.__name__, klass.regex) for klass in self.token_classes
+                '(?P<%s>%s)' % (klass.__name__, klass.regex) for klass in token_classes
             ),
             re.X | re.I | re.S
         ).match
+        classes_by_name = dict((klass.__name__, klass) for klass in token_classes)
+        def get_token(string, start):
+            # type: (str, int) -> Any
+            mobj = match(string, start)
+            if mobj:
+                return classes_by_name[mobj.lastgroup](mobj)
+            return None
+        return get_token
+
+    def _compile_regex(self):
+        # type: () -> None
+        self.get_token = self._compile(tuple(
+            klass for klass in self.token_classes if klass is not Text
+        ))
+        self._raw_classes = [
+            klass for klass in self.token_classes if issubclass(klass, RawContentToken)
+        ]
+        # characters after '<' with which a raw content token can start,
+        # None if any character is possible
+        self._raw_first_chars = frozenset(
+            ''.join(klass.first_chars or '' for klass in self._raw_classes)
+        ) if all(klass.first_chars for klass in self._raw_classes) else None
+
+    def _get_token_for(self, char):
+        # type: (str) -> Any
+        # A smaller alternation, restricted to the token classes that can
+        # start with '<' followed by `char`. The order of the classes is
+        # kept, so the result is the same as with the whole alternation.
+        try:
+            return self._get_token_by_char[char]
+        except KeyError:
+            pass
+        classes = tuple(
+            klass for klass in self.token_classes
+            if klass is not Text and (klass.first_chars is None or char in klass.first_chars)
+        )
+        try:
+            get_token = self._get_token_by_classes[classes]
+        except KeyError:
+            get_token = self._get_token_by_classes[classes] = self._compile(classes)
+        self._get_token_by_char[char] = get_token
+        return get_token
 
     def tokenize(self, string):
         # type: (str) -> List[Any]
+        return self._tokenize(string, True)[0]
+
+    def tokenize_stream(self, string):
+        # type: (str) -> TokenStream
+        """
+        same as `tokenize`, but returns a TokenStream instead of a list of tokens
+        """
+        stream = TokenStream(string, self.token_classes)
+        start = 0
+        length = len(string)
+        while start < length:
+            tokens, start = self._tokenize(string, True, start, min(start + self.batch_size, length))
+            stream.extend(tokens)
+        return stream
+
+    # number of characters tokenized at a time by tokenize_stream
+    batch_size = 1 << 16
+
+    def tokenize_chunks(self, chunks):
+        # type: (Iterable[str]) -> Iterator[List[Any]]
+        """
+        tokenizes a document given as an iterable of strings, yielding lists
+        of tokens as soon as they're complete. A token is only accepted once
+        at least `lookahead` characters follow it (or at the end of the document),
+        so that the tokens are the same as with `tokenize`, except for
+        tags with quoted attribute values containing '>' characters and
+        spanning more than `lookahead` characters.
+        """
+        pending = ''
+        parts = [] # type: List[str]
+        parts_length = 0
+        needed = 0
+        for chunk in chunks:
+            parts.append(chunk)
+            parts_length += len(chunk)
+            if parts_length < needed:
+                continue
+            pending = pending + ''.join(parts)
+            parts = []
+            parts_length = 0
+            tokens, consumed = self._tokenize(pending, False)
+            if tokens:
+                yield tokens
+            pending = pending[consumed:]
+            # the last `lookahead` characters will be tokenized again, so wait for
+            # at least as many new characters. If no token could be completed
+            # (a long script for instance), wait for the pending text to double.
+            needed = len(pending) if not consumed else self.lookahead
+        pending = pending + ''.join(parts)
+        tokens, consumed = self._tokenize(pending, True)
+        if tokens:
+            yield tokens
+
+    # see tokenize_chunks
+    lookahead = 4096
+
+    def _incomplete_raw_content(self, string, start):
+        # type: (str, int) -> bool
+        # whether a raw content token (script, comment...) starts at `start`
+        # but its end isn't in `string` yet
+        return any(klass._match_start(string, start) for klass in self._raw_classes)
+
+    def _tokenize(self, string, final, start = 0, stop = None):
+        # type: (str, bool, int, Optional[int]) -> Tuple[List[Any], int]
+        # returns the tokens starting between `start` and `stop` (defaults to
+        # the end of the string) and the position where tokenization stopped.
+        # If `final` is False, `string` is only the beginning of the document
+        # and the tokens that may not be complete are left out.
         if not self.get_token:
             self._compile_regex()
         result = [] # type: List[Any]
         append = result.append
-        start = 0
+        get_token_by_char = self._get_token_by_char
+        text_end = self.__class__._text_end
+        has_text = Text in self.token_classes
+        from_content = Text.from_content
         l = len(string)
-        while start < l:
-            mobj = self.get_token(string, start)
-            if mobj:
-                groupdict = mobj.groupdict()
-                class_name = next(name for name in self.token_names if groupdict[name])
-                token = TokenMeta.getclass(class_name)(groupdict)
+        if stop is None:
+            stop = l
+        limit = l if final else l - self.lookahead
+        raw_first_chars = self._raw_first_chars
+        while start < stop:
+            char = string[start]
+            if char != '<':
+                if char != '>' and has_text:
+                    mobj = text_end(string, start)
+                    end = mobj.start() if mobj else l
+                    if end > limit:
+                        break
+                    append(from_content(string[start:end]))
+                    start = end
+                    continue
+                token = None
+            elif start + 1 < l and not string[start + 1].isspace():
+                char = string[start + 1]
+                try:
+                    get_token = get_token_by_char[char]
+                except KeyError:
+                    get_token = self._get_token_for(char)
+                token = get_token(string, start)
+            else:
+                char = None
+                token = self.get_token(string, start)
+            if token is not None:
+                end = start + len(token.content)
+                if end > limit or (
+                    not final and (char is None or raw_first_chars is None or char in raw_first_chars)
+                    and not isinstance(token, RawContentToken)
+                    and self._incomplete_raw_content(string, start)
+                ):
+                    break
                 append(token)
-                start += len(token.content)
+                start = end
+            elif not final:
+                # the token may continue after the end of `string`
+                # (a tag longer than `lookahead` for example)
+                break
             else:
-                raise XMLTokenError("Unrecognized XML token near %s" % repr(string[:100]))
+                raise XMLTokenError("Unrecognized XML token near %s" % repr(string[start:start+100]))
 
-        return result
+        return result, start
+
+class TokenStream(object):
+    """
+    compact sequence of the tokens of a document. Instead of token objects,
+    it holds arrays: the index of the class of each token in `token_classes`
+    (`kinds`), the offset in `source` where each token ends (`ends`, a token
+    starts where the previous one ends) and the tag name of each token
+    (`name_ids`, indexes in the `tag_names` list, 0 for tokens without one).
+    That's 13 bytes per token, and the content of the tokens isn't copied.
+
+    Indexing a TokenStream returns a token object, created on the fly.
+    """
 
-tokenize = Tokenizer(
+    def __init__(self, source, token_classes):
+        # type: (str, Tuple[Any, ...]) -> None
+        self.source = source
+        self.token_classes = token_classes
+        self.kinds = bytearray()
+        self.ends = array.array('q')
+        self.name_ids = array.array('I')
+        self.tag_names = [None] # type: List[Optional[str]]
+        self._name_ids = {None: 0} # type: Dict[Optional[str], int]
+        self._kind_of = dict((klass, kind) for kind, klass in enumerate(token_classes))
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.kinds)
+
+    def __getitem__(self, i):
+        # type: (int) -> Any
+        token = self.token_classes[self.kinds[i]].from_content(self.content(i))
+        if self.name_ids[i]:
+            token.tag_name = self.tag_names[self.name_ids[i]]
+        return token
+
+    def __iter__(self):
+        # type: () -> Iterator[Any]
+        for i in range(len(self.kinds)):
+            yield self[i]
+
+    def start(self, i):
+        # type: (int) -> int
+        return self.ends[i - 1] if i else 0
+
+    def content(self, i):
+        # type: (int) -> str
+        return self.source[self.start(i):self.ends[i]]
+
+    def tag_name(self, i):
+        # type: (int) -> Optional[str]
+        return self.tag_names[self.name_ids[i]]
+
+    def isblank(self, i):
+        # type: (int) -> bool
+        return _non_blank(self.source, self.start(i), self.ends[i]) is None
+
+    def append(self, kind, end, tag_name):
+        # type: (int, int, Optional[str]) -> None
+        self.kinds.append(kind)
+        self.ends.append(end)
+        self.name_ids.append(self._name_id(tag_name))
+
+    def extend(self, tokens):
+        # type: (List[Any]) -> None
+        """
+        appends the tokens of a list. The first one must start where the
+        last token of the stream ends.
+        """
+        kind_of = self._kind_of
+        self.kinds.extend(bytes(bytearray([kind_of[type(token)] for token in tokens])))
+        # (no `initial` argument for accumulate before Python 3.8)
+        ends = itertools.accumulate(
+            [self.ends[-1] if self.ends else 0] + [len(token.content) for token in tokens]
+        )
+        next(ends) # the initial value
+        self.ends.extend(ends)
+        name_id = self._name_id
+        self.name_ids.extend([name_id(getattr(token, 'tag_name', None)) for token in tokens])
+
+    def _name_id(self, tag_name):
+        # type: (Optional[str]) -> int
+        try:
+            return self._name_ids[tag_name]
+        except KeyError:
+            self._name_ids[tag_name] = name_id = len(self.tag_names)
+            self.tag_names.append(tag_name)
+            return name_id
+
+    def items(self):
+        # type: () -> Iterator[Tuple[Any, str]]
+        """
+        yields the class and the content of each token
+        """
+        classes = self.token_classes
+        source = self.source
+        start = 0
+        for kind, end in zip(self.kinds, self.ends):
+            yield classes[kind], source[start:end]
+            start = end
+
+_non_blank = re.compile(r'\S').search
+
+_tokenizer = Tokenizer(
     (Text, Comment, CData, Doctype, XMLDeclaration, Script, Style, OpenTag, SelfTag, CloseTag, XMLProcessingInstruction)
-).tokenize
+)
+tokenize = _tokenizer.tokenize
+tokenize_stream = _tokenizer.tokenize_stream
+tokenize_chunks = _tokenizer.tokenize_chunks
+
+# flags of the tokens of a document, computed by _match_tags_in_chunks
+# (the first three are also used by TagMatcher)
+_OPEN = 1
+_CLOSE = 2
+_TEXT = 4 # text that's not ignored
+_MATCHED = 8
+_DIRECT_TEXT = 16
 
 class TagMatcher(object):
+    """
+    finds which open and close tags of a list of tokens (or TokenStream) match.
+    A close tag matches the last open tag with the same name that isn't
+    matched yet.
 
-    class SameNameMatcher(object):
-        def __init__(self):
-            # type: () -> None
-            self.unmatched_open = [] # type: List[Any]
-            self.matched = {} # type: Dict[str, Any]
-
-        def sigclose(self, i):
-            # type: (Any) -> Any
-            if self.unmatched_open:
-                open_tag = self.unmatched_open.pop()
-                self.matched[open_tag] = i
-                self.matched[i] = open_tag
-                return open_tag
-            else:
-                return None
-
-        def sigopen(self, i):
-            # type: (Any) -> Any
-            self.unmatched_open.append(i)
+    The result is held in arrays: `match[i]` is the index of the tag matching
+    the tag at index `i`, or -1, and `direct_text` is a bitset telling which
+    open tags directly contain text (text that's not blank, unless `blank_is_text`).
+    """
 
     def __init__(self, token_list, blank_is_text = False):
-        # type: (List[Any], bool) -> None
+        # type: (Union[List[Any], TokenStream], bool) -> None
         self.token_list = token_list
-        self.name_matchers = {} # type: Dict[str, Any]
-        self.direct_text_parents = set() # type: Set[Any]
-
-        for i in range(len(token_list)):
-            token = token_list[i]
-            tpe = type(token)
-            if tpe is OpenTag:
-                self._get_name_matcher(token.tag_name).sigopen(i)
-            elif tpe is CloseTag:
-                self._get_name_matcher(token.tag_name).sigclose(i)
-
-        # TODO move this somewhere else
-        current_nodes = []
-        for i in range(len(token_list)):
-            token = token_list[i]
-            tpe = type(token)
-            if tpe is OpenTag and self.ismatched(i):
-                current_nodes.append(i)
-            elif tpe is CloseTag and self.ismatched(i):
-                current_nodes.pop()
-            elif tpe is Text and (blank_is_text or not token.isblank):
+        count = len(token_list)
+        if isinstance(token_list, TokenStream):
+            table = bytearray(256)
+            for kind, klass in enumerate(token_list.token_classes):
+                table[kind] = _matcher_codes.get(klass, 0)
+            codes = bytes(token_list.kinds.translate(table))
+            names = token_list.name_ids # type: Any
+            isblank = token_list.isblank # type: Any
+        else:
+            codes = bytes(bytearray([_matcher_codes.get(type(token), 0) for token in token_list]))
+            names = [getattr(token, 'tag_name', None) for token in token_list]
+            isblank = lambda i: token_list[i].isblank
+        self.match = match = array.array('i' if count < 1 << 31 else 'q', [-1]) * count
+        self.direct_text = direct_text = bytearray((count + 7) >> 3)
+
+        # open tags, matched close tags and texts, in order. Whether an open
+        # tag is matched is only known once all the tokens have been seen.
+        nodes = array.array(match.typecode)
+        unmatched_open = {} # type: Dict[Any, List[int]]
+        for i, code in enumerate(codes):
+            if not code:
+                continue
+            if code == _OPEN:
+                try:
+                    unmatched_open[names[i]].append(i)
+                except KeyError:
+                    unmatched_open[names[i]] = [i]
+                nodes.append(i)
+            elif code == _CLOSE:
+                stack = unmatched_open.get(names[i])
+                if stack:
+                    open_index = stack.pop()
+                    match[open_index] = i
+                    match[i] = open_index
+                    nodes.append(i)
+            elif blank_is_text or not isblank(i):
+                nodes.append(i)
+
+        current_nodes = [] # type: List[int]
+        for i in nodes:
+            code = codes[i]
+            if code == _TEXT:
                 if current_nodes:
-                    self.direct_text_parents.add(current_nodes[-1])
-
-    def _get_name_matcher(self, tag_name):
-        # type: (str) -> Any
-        try:
-            return self.name_matchers[tag_name]
-        except KeyError:
-            self.name_matchers[tag_name] = name_matcher = self.__class__.SameNameMatcher()
-            return name_matcher
+                    parent = current_nodes[-1]
+                    direct_text[parent >> 3] |= 1 << (parent & 7)
+            elif code == _CLOSE:
+                current_nodes.pop()
+            elif match[i] >= 0:
+                current_nodes.append(i)
 
     def ismatched(self, i):
-        # type: (Any) -> bool
-        return i in self.name_matchers[self.token_list[i].tag_name].matched
+        # type: (int) -> bool
+        return self.match[i] >= 0
 
     def directly_contains_text(self, i):
-        # type: (Any) -> bool
-        return i in self.direct_text_parents
+        # type: (int) -> bool
+        return bool(self.direct_text[i >> 3] & (1 << (i & 7)))
+
+_matcher_codes = {OpenTag: _OPEN, CloseTag: _CLOSE, Text: _TEXT}
 
 new_line_rgx= re.compile(r'(\r?\n)', flags = re.MULTILINE)
 
-def indent(string, indentation = '  ', newline = '\n', indent_text = NO, blank_is_text = False):
-    # type: (str, str, str, bool, bool) -> Any
+def indent(string, indentation = '  ', newline = '\n', indent_text = NO, blank_is_text = False,
+ cache = None):
+    # type: (str, str, str, bool, bool, Any) -> Any
     """
     takes a string representing a html or xml document and returns
      a well indented version of it
@@ -322,17 +751,57 @@ def indent(string, indentation = '  ', newline = '\n', indent_text = NO, blank_i
 
     - blank_is_text:
         if False, completely blank texts are ignored. That is the default.
+
+    - cache:
+        optional yattag.cache.LRUCache instance (or any object with the same
+        `get` and `set` methods), in which the indented documents are stored,
+        keyed by a hash of `string` and the other arguments. When the same
+        document is indented again with the same options, the result is
+        taken from the cache: that costs one hash of the document.
+
+            indent_cache = LRUCache(maxsize = 1000, maxbytes = 50 * 1024 * 1024)
+            html = indent(fragment, cache = indent_cache)
     """
-    tokens = tokenize(string)
+    if cache is not None:
+        key = (
+            hashlib.blake2b(string.encode('utf-8', 'surrogatepass')).digest(),
+            indentation, newline, indent_text, blank_is_text
+        )
+        result = cache.get(key)
+        if result is None:
+            result = indent(string, indentation, newline, indent_text, blank_is_text)
+            cache.set(key, result)
+        return result
+    tokens = tokenize_stream(string)
     tag_matcher = TagMatcher(tokens, blank_is_text = blank_is_text)
-    ismatched = tag_matcher.ismatched
-    directly_contains_text = tag_matcher.directly_contains_text
     result = [] # type: List[Any]
-    append = result.append
-    level = 0
-    sameline = 0
-    was_just_opened = False
-    tag_appeared = False
+    _indent_tokens(
+        tokens.items(), 0, tag_matcher.ismatched, tag_matcher.directly_contains_text,
+        _IndentState(), result.append, indentation, newline, indent_text, blank_is_text
+    )
+    return ''.join(result)
+
+class _IndentState(object):
+    # state of the indentation loop between two calls of _indent_tokens
+    __slots__ = ('level', 'sameline', 'was_just_opened', 'tag_appeared')
+
+    def __init__(self):
+        # type: () -> None
+        self.level = 0
+        self.sameline = 0
+        self.was_just_opened = False
+        self.tag_appeared = False
+
+def _indent_tokens(items, first_index, ismatched, directly_contains_text, state,
+ append, indentation, newline, indent_text, blank_is_text):
+    # type: (Iterable[Tuple[Any, str]], int, Any, Any, _IndentState, Any, str, str, Any, bool) -> None
+    # appends the indented tokens, given as (class, content) pairs (see
+    # TokenStream.items and _items). `first_index` is the index of the first
+    # token in the whole document, as used by `ismatched` and `directly_contains_text`.
+    level = state.level
+    sameline = state.sameline
+    was_just_opened = state.was_just_opened
+    tag_appeared = state.tag_appeared
     def _indent():
         # type: () -> None
         if tag_appeared:
@@ -347,11 +816,10 @@ def indent(string, indentation = '  ', newline = '\n', indent_text = NO, blank_i
             append(new_line_rgx.sub(r'\1' + indentation * level, text))
         else:
             append(text)
-    for i,token in enumerate(tokens):
-        tpe = type(token)
+    for i, (tpe, content) in enumerate(items, first_index):
         if tpe is Text:
-            if blank_is_text or not token.isblank:
-                _append_text(token.content)
+            if blank_is_text or _non_blank(content):
+                _append_text(content)
                 was_just_opened = False
         elif tpe is OpenTag and ismatched(i):
             was_just_opened = True
@@ -361,7 +829,7 @@ def indent(string, indentation = '  ', newline = '\n', indent_text = NO, blank_i
                 _indent()
             if indent_text is NO and directly_contains_text(i):
                 sameline = sameline or 1
-            append(token.content)
+            append(content)
             level += 1
             tag_appeared = True
         elif tpe is CloseTag and ismatched(i):
@@ -371,16 +839,445 @@ def indent(string, indentation = '  ', newline = '\n', indent_text = NO, blank_i
                 sameline -= 1
             elif not was_just_opened:
                 _indent()
-            append(token.content)
+            append(content)
             was_just_opened = False
         else:
             if not sameline:
                 _indent()
-            append(token.content)
+            append(content)
             was_just_opened = False
             tag_appeared = True
+    state.level = level
+    state.sameline = sameline
+    state.was_just_opened = was_just_opened
+    state.tag_appeared = tag_appeared
+
+def _items(tokens):
+    # type: (List[Any]) -> Iterator[Tuple[Any, str]]
+    # the (class, content) pairs of a list of tokens, for _indent_tokens
+    for token in tokens:
+        yield type(token), token.content
+
+def _match_tags_in_chunks(token_lists, blank_is_text = False):
+    # type: (Iterable[List[Any]], bool) -> bytearray
+    # same as TagMatcher, for a document given as successive lists of tokens,
+    # without keeping the tokens: returns one byte of flags per token
+    flags = bytearray()
+    unmatched_open = {} # type: Dict[str, List[int]]
+    i = 0
+    for tokens in token_lists:
+        flags.extend(bytes(len(tokens)))
+        for token in tokens:
+            tpe = type(token)
+            if tpe is OpenTag:
+                flags[i] = _OPEN
+                try:
+                    unmatched_open[token.tag_name].append(i)
+                except KeyError:
+                    unmatched_open[token.tag_name] = [i]
+            elif tpe is CloseTag:
+                stack = unmatched_open.get(token.tag_name)
+                if stack:
+                    flags[stack.pop()] |= _MATCHED
+                    flags[i] = _CLOSE | _MATCHED
+                else:
+                    flags[i] = _CLOSE
+            elif tpe is Text and (blank_is_text or not token.isblank):
+                flags[i] = _TEXT
+            i += 1
+    current_nodes = [] # type: List[int]
+    open_matched = _OPEN | _MATCHED
+    close_matched = _CLOSE | _MATCHED
+    for i, flag in enumerate(flags):
+        if not flag:
+            continue
+        if flag == open_matched:
+            current_nodes.append(i)
+        elif flag == close_matched:
+            current_nodes.pop()
+        elif flag == _TEXT and current_nodes:
+            flags[current_nodes[-1]] |= _DIRECT_TEXT
+    return flags
+
+def _read_chunks(source, encoding, chunk_size):
+    # type: (Any, str, int) -> Iterator[str]
+    # reads the document from a path, a file object or a buffer (mmap, bytes...)
+    if isinstance(source, str) or hasattr(source, '__fspath__'):
+        with open(source, 'rb') as fileobj:
+            for chunk in _read_chunks(fileobj, encoding, chunk_size):
+                yield chunk
+        return
+    if hasattr(source, 'read') and not isinstance(source, mmap.mmap):
+        read = source.read
+        chunks = iter(lambda: read(chunk_size), source.read(0))
+    else:
+        view = memoryview(source)
+        chunks = (view[start:start + chunk_size] for start in range(0, len(view), chunk_size))
+    decoder = None
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            yield chunk
+            continue
+        if decoder is None:
+            decoder = codecs.getincrementaldecoder(encoding)()
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    if decoder is not None:
+        text = decoder.decode(b'', True)
+        if text:
+            yield text
+
+def _seekable(fileobj):
+    # type: (Any) -> bool
+    seekable = getattr(fileobj, 'seekable', None)
+    if seekable is not None:
+        return seekable()
+    return hasattr(fileobj, 'seek') and hasattr(fileobj, 'tell')
+
+def _spool(fileobj, chunk_size):
+    # type: (Any, int) -> Any
+    # copies what's left to read from `fileobj` to a temporary file
+    # of the same mode (binary or text), rewound
+    chunk = fileobj.read(chunk_size)
+    if isinstance(chunk, str):
+        spool = tempfile.TemporaryFile('w+', encoding = 'utf-8', newline = '') # type: Any
+    else:
+        spool = tempfile.TemporaryFile('w+b')
+    spool.write(chunk)
+    shutil.copyfileobj(fileobj, spool, chunk_size)
+    spool.seek(0)
+    return spool
+
+def indent_stream(source, sink, indentation = '  ', newline = '\n', indent_text = NO,
+ blank_is_text = False, encoding = 'utf-8', chunk_size = 1 << 20):
+    # type: (Any, Any, str, str, Any, bool, str, int) -> None
+    """
+    same as `indent`, for documents too large to be held in memory:
+    the document is read from `source` and the indented version is written
+    to `sink`, one chunk at a time.
+
+    arguments:
+    - source: the path of the document, a file object (binary or text)
+      or a buffer such as a memory map (mmap.mmap instance) or bytes.
+      File objects that can't be rewound (pipes, sockets...) are first copied
+      to a temporary file.
+    - sink: a file-like object open in text mode (anything with a `write` method)
+      or a callable taking a string
+    - indentation, newline, indent_text, blank_is_text: see `indent`
+    - encoding: the encoding of the document, if read as bytes.
+      Defaults to 'utf-8'.
+    - chunk_size: the size of the chunks read from the source.
+      Defaults to 1MB.
+
+    The document is read twice: first to find which tags are matched and
+    which ones directly contain text, then to write the indented document.
+    In between, only one byte per token is kept in memory.
+    """
+    if hasattr(source, 'read') and not isinstance(source, mmap.mmap) and not _seekable(source):
+        # the source can't be read twice
+        with _spool(source, chunk_size) as spool:
+            return indent_stream(
+                spool, sink, indentation, newline, indent_text, blank_is_text, encoding, chunk_size
+            )
+    write = getattr(sink, 'write', sink)
+    start = source.tell() if hasattr(source, 'seek') and not isinstance(source, mmap.mmap) else None
+    flags = _match_tags_in_chunks(
+        tokenize_chunks(_read_chunks(source, encoding, chunk_size)), blank_is_text
+    )
+    if start is not None:
+        source.seek(start)
+    ismatched = lambda i: flags[i] & _MATCHED
+    directly_contains_text = lambda i: flags[i] & _DIRECT_TEXT
+    state = _IndentState()
+    first_index = 0
+    for tokens in tokenize_chunks(_read_chunks(source, encoding, chunk_size)):
+        result = [] # type: List[str]
+        _indent_tokens(
+            _items(tokens), first_index, ismatched, directly_contains_text, state,
+            result.append, indentation, newline, indent_text, blank_is_text
+        )
+        first_index += len(tokens)
+        write(''.join(result))
+
+# the document being indented by indent_parallel, in the worker processes
+_worker_string = None # type: Optional[str]
+
+def _init_worker(string):
+    # type: (str) -> None
+    global _worker_string
+    _worker_string = string
+
+def _tokenize_range(bounds):
+    # type: (Tuple[int, int]) -> Tuple[int, int, bytes, Any, Any, List[Optional[str]]]
+    # tokenizes the tokens of the document starting between `start` and `stop`,
+    # as if tokenization started at `start`. Returns them in a compact form:
+    # the index of their class in the token classes, their ends, and the
+    # indexes of their tag names in a table of the tag names of the chunk
+    # (0 for tokens without one).
+    start, stop = bounds
+    string = _worker_string
+    assert string is not None
+    try:
+        tokens, _ = _tokenizer._tokenize(string, True, start, stop)
+    except XMLTokenError:
+        # the chunk doesn't start at a token, leave it to the main process
+        tokens = []
+    kind_of = dict((cls, kind) for kind, cls in enumerate(_tokenizer.token_classes))
+    kinds = bytes(bytearray([kind_of[type(token)] for token in tokens]))
+    # (no `initial` argument for accumulate before Python 3.8)
+    ends = array.array('q', itertools.accumulate([start] + [len(token.content) for token in tokens]))
+    del ends[0]
+    name_ids = {None: 0} # type: Dict[Optional[str], int]
+    names = [None] # type: List[Optional[str]]
+    ids = array.array('I')
+    for token in tokens:
+        name = getattr(token, 'tag_name', None)
+        name_id = name_ids.get(name)
+        if name_id is None:
+            name_ids[name] = name_id = len(names)
+            names.append(name)
+        ids.append(name_id)
+    return start, stop, kinds, ends, ids, names
+
+def indent_parallel(string, processes = None, chunk_size = 1 << 22, indentation = '  ',
+ newline = '\n', indent_text = NO, blank_is_text = False):
+    # type: (str, Optional[int], int, str, str, Any, bool) -> str
+    """
+    same as `indent`, with the document tokenized by several worker processes
+    (as many as CPUs by default). The result is identical to the one of `indent`.
+
+    The document is cut into chunks of about `chunk_size` characters, at '<'
+    characters, and each chunk is tokenized by a worker as if a token started
+    there. If that's not the case (the '<' was in a comment or script for example),
+    the tokens of the previous chunk go beyond the cut, and the tokenization
+    of the chunk is only used from the first token starting where a
+    token of the previous chunk ends. If there's none, the part in
+    question is tokenized again in the main process.
+    Tag matching and the indentation itself are done in the main process.
+    """
+    bounds = [0]
+    while bounds[-1] + chunk_size < len(string):
+        cut = string.find('<', bounds[-1] + chunk_size)
+        if cut == -1:
+            break
+        bounds.append(cut)
+    bounds.append(len(string))
+    ranges = list(zip(bounds, bounds[1:]))
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = min(processes, len(ranges))
+    pool = None
+    if processes <= 1:
+        _init_worker(string)
+        results = map(_tokenize_range, ranges) # type: Iterable[Any]
+    else:
+        pool = multiprocessing.Pool(processes, initializer = _init_worker, initargs = (string,))
+        results = pool.imap(_tokenize_range, ranges, chunksize = 1)
+
+    # merge the chunks as they come
+    stream = TokenStream(string, _tokenizer.token_classes)
+    name_id = stream._name_id
+    position = 0 # end of the tokens merged so far
+    try:
+        for start, stop, chunk_kinds, chunk_ends, chunk_ids, chunk_names in results:
+            covered = chunk_ends[-1] if len(chunk_ends) else stop
+            while True:
+                if position == start and len(chunk_ends):
+                    first = 0
+                    break
+                # find the token of the chunk starting where the merged tokens end
+                first = bisect.bisect_left(chunk_ends, position)
+                if first < len(chunk_ends) and chunk_ends[first] == position:
+                    first += 1
+                    break
+                if position >= covered:
+                    first = len(chunk_ends)
+                    break
+                # no such token: tokenize one more token in the main process
+                tokens, position = _tokenizer._tokenize(string, True, position, position + 1)
+                stream.extend(tokens)
+            stream.kinds.extend(chunk_kinds[first:])
+            stream.ends.extend(chunk_ends[first:])
+            # tag names of the chunk to tag names of the stream
+            table = [name_id(name) for name in chunk_names]
+            stream.name_ids.extend(array.array('I', [table[i] for i in chunk_ids[first:]]))
+            if len(stream):
+                position = stream.ends[-1]
+    finally:
+        if pool is None:
+            _init_worker(None) # type: ignore
+        else:
+            pool.close()
+            pool.join()
+
+    tag_matcher = TagMatcher(stream, blank_is_text = blank_is_text)
+    result = [] # type: List[Any]
+    _indent_tokens(
+        stream.items(), 0, tag_matcher.ismatched, tag_matcher.directly_contains_text,
+        _IndentState(), result.append, indentation, newline, indent_text, blank_is_text
+    )
     return ''.join(result)
 
+def _output_path(path, output_dir):
+    # type: (str, str) -> str
+    relative_path = os.path.relpath(path)
+    if os.path.isabs(relative_path) or relative_path.startswith(os.pardir):
+        relative_path = os.path.basename(path)
+    return os.path.join(output_dir, relative_path)
+
+def _indent_file(task):
+    # type: (Tuple[str, Optional[str], bool, str, Dict[str, Any]]) -> Tuple[str, str]
+    # indents one file for indent_many, possibly in a worker process
+    path, output_path, force, encoding, options = task
+    if output_path is None:
+        output_path = path
+    elif not force and os.path.exists(output_path) \
+     and os.path.getmtime(output_path) >= os.path.getmtime(path):
+        return path, 'skipped'
+    with open(path, encoding = encoding, newline = '') as fileobj:
+        content = fileobj.read()
+    indented = indent(content, **options)
+    if not indented.endswith(options['newline']):
+        indented += options['newline']
+    if output_path == path and indented == content:
+        return path, 'unchanged'
+    directory = os.path.dirname(output_path)
+    if directory and not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError: # created by another worker in the meantime
+            if not os.path.isdir(directory):
+                raise
+    # written to a temporary file first, so that the input is left
+    # untouched if anything goes wrong
+    fd, temp_path = tempfile.mkstemp(
+        dir = directory or os.curdir, prefix = '.%s.' % os.path.basename(output_path)
+    )
+    try:
+        with open(fd, 'w', encoding = encoding, newline = '') as fileobj:
+            fileobj.write(indented)
+        shutil.copymode(path, temp_path)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return path, 'indented'
+
+def _expand(pattern):
+    # type: (str) -> List[str]
+    # the paths matching a glob pattern, or the path itself if it isn't one
+    if any(char in pattern for char in '*?['):
+        return sorted(glob.glob(pattern, recursive = True))
+    return [pattern]
+
+def indent_many(paths, output_dir = None, processes = None, force = False, encoding = 'utf-8',
+ indentation = '  ', newline = '\n', indent_text = NO, blank_is_text = False):
+    # type: (Iterable[str], Optional[str], Optional[int], bool, str, str, str, Any, bool) -> List[Tuple[str, str]]
+    """
+    indents many files, using a pool of worker processes
+
+    arguments:
+    - paths: the paths of the files, or glob patterns like 'feeds/**/*.xml'
+    - output_dir: the directory where the indented files are written,
+      keeping their path relative to the current directory (or only their name
+      for files outside of it). If None (the default), the files are indented in place.
+    - processes: the number of worker processes. Defaults to the number of CPUs.
+      With 1, the files are indented in the current process.
+    - force: unless set to True, files whose output file is more recent are skipped,
+      and files that are already indented are not rewritten (in place mode).
+    - encoding: the encoding of the files. Defaults to 'utf-8'.
+    - indentation, newline, indent_text, blank_is_text: see `indent`
+
+    The indented files end with a new line.
+
+    returns a list of (path, status) pairs in the order of the paths, the status being
+    'indented', 'unchanged' (already indented) or 'skipped' (output file up to date).
+    """
+    options = dict(
+        indentation = indentation, newline = newline,
+        indent_text = indent_text, blank_is_text = blank_is_text
+    )
+    tasks = []
+    for pattern in paths:
+        for path in _expand(pattern):
+            output_path = None if output_dir is None else _output_path(path, output_dir)
+            tasks.append((path, output_path, force, encoding, options))
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = min(processes, len(tasks))
+    if processes <= 1:
+        return [_indent_file(task) for task in tasks]
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(_indent_file, tasks, chunksize = max(1, len(tasks) // (processes * 8)))
+    finally:
+        pool.close()
+        pool.join()
+
+def main(argv = None):
+    # type: (Optional[List[str]]) -> int
+    """
+    command line interface (python -m yattag.indentation --help)
+    """
+    parser = argparse.ArgumentParser(
+        prog = 'python -m yattag.indentation',
+        description = "Indents html or xml documents. With no path, the document is read "
+            "from the standard input. With a single path and neither --in-place nor "
+            "--output-dir, the indented document is written to the standard output."
+    )
+    parser.add_argument('paths', nargs = '*', help = "paths of the documents, or glob patterns")
+    parser.add_argument('-i', '--in-place', action = 'store_true', help = "indent the files in place")
+    parser.add_argument('-o', '--output-dir', help = "directory where the indented files are written")
+    parser.add_argument('-j', '--jobs', type = int, default = None,
+        help = "number of worker processes (defaults to the number of CPUs)")
+    parser.add_argument('-f', '--force', action = 'store_true',
+        help = "indent the files even if they look up to date")
+    parser.add_argument('--indentation', default = '  ',
+        help = "the indentation unit, defaults to two spaces (\\t for a tab)")
+    parser.add_argument('--newline', choices = ('lf', 'crlf'), default = 'lf',
+        help = "the new line sequence, defaults to lf")
+    parser.add_argument('--indent-text', choices = ('no', 'first-line', 'each-line'), default = 'no',
+        help = "how to indent text nodes (see the indent_text argument of indent)")
+    parser.add_argument('--blank-is-text', action = 'store_true',
+        help = "don't ignore blank text nodes")
+    parser.add_argument('--encoding', default = 'utf-8', help = "encoding of the files, defaults to utf-8")
+    args = parser.parse_args(argv)
+
+    options = dict(
+        indentation = args.indentation.replace('\\t', '\t'),
+        newline = {'lf': '\n', 'crlf': '\r\n'}[args.newline],
+        indent_text = {'no': NO, 'first-line': FIRST_LINE, 'each-line': EACH_LINE}[args.indent_text],
+        blank_is_text = args.blank_is_text,
+    )
+    if args.in_place or args.output_dir:
+        if args.in_place and args.output_dir:
+            parser.error("--in-place and --output-dir can't be used together")
+        if not args.paths:
+            parser.error("paths are required with --in-place or --output-dir")
+        results = indent_many(
+            args.paths, output_dir = args.output_dir, processes = args.jobs,
+            force = args.force, encoding = args.encoding, **options
+        )
+        counts = {} # type: Dict[str, int]
+        for path, status in results:
+            counts[status] = counts.get(status, 0) + 1
+        sys.stderr.write(', '.join(
+            '%d %s' % (counts[status], status) for status in ('indented', 'unchanged', 'skipped')
+            if status in counts
+        ) + '\n')
+        return 0
+    paths = [path for pattern in args.paths for path in _expand(pattern)]
+    if len(paths) > 1:
+        parser.error("use --in-place or --output-dir to indent several files")
+    if args.paths and not paths:
+        parser.error("no file matches %s" % args.paths[0])
+    if paths:
+        indent_stream(paths[0], sys.stdout, encoding = args.encoding, **options)
+    else:
+        indent_stream(sys.stdin, sys.stdout, **options)
+    sys.stdout.write('\n')
+    return 0
+
 if __name__ == '__main__':
-    import sys
-    print(indent(sys.stdin.read()))
+    sys.exit(main())
@@ -1,10 +1,14 @@
 __all__ = ['SimpleDoc']
 
+import codecs
 import re
 from typing import Any
 from typing import Callable
 from typing import Dict
+from typing import Iterable
+from typing import Iterator
 from typing import List
+from typing import Optional
 from typing import Set
 from typing import Tuple
 from typing import Union
@@ -29,8 +33,11 @@ class SimpleDoc(object):
     """
 
     class Tag(object):
+        __slots__ = ('doc', 'name', 'attrs', 'parent_tag', 'position')
+
         def __init__(self, doc, name, attrs): # name is the tag name (ex: 'div')
-            # type: (SimpleDoc, str, Dict[str, Union[str, int, float]]) -> None
+            # type: (SimpleDoc, str, Optional[Dict[str, Union[str, int, float]]]) -> None
+            # attrs is None rather than an empty dictionary when there's no attribute
 
             self.doc = doc
             self.name = name
@@ -38,6 +45,8 @@ class SimpleDoc(object):
 
         def __enter__(self):
             # type: () -> None
+            if self.doc._sink is not None:
+                self.doc._freeze_current_tag()
             self.parent_tag = self.doc.current_tag
             self.doc.current_tag = self
             self.position = len(self.doc.result)
@@ -46,15 +55,222 @@ class SimpleDoc(object):
         def __exit__(self, tpe, value, traceback):
             # type: (Any, Any, Any) -> None
             if value is None:
-                if self.attrs:
-                    self.doc.result[self.position] = "<%s %s>" % (
-                        self.name,
-                        dict_to_attrs(self.attrs),
-                    )
-                else:
-                    self.doc.result[self.position] = "<%s>" % self.name
+                if self.position is not None:
+                    self.doc.result[self.position] = self.render_opening()
                 self.doc._append("</%s>" % self.name)
                 self.doc.current_tag = self.parent_tag
+                if self.doc._flushing:
+                    self.doc._flush()
+
+        def render_opening(self):
+            # type: () -> str
+            if self.attrs:
+                return "<%s %s>" % (self.name, dict_to_attrs(self.attrs))
+            else:
+                return "<%s>" % self.name
+
+        def freeze(self):
+            # type: () -> None
+            # streaming mode: the opening tag is rendered for good
+            if self.position is not None:
+                self.doc.result[self.position] = self.render_opening()
+                self.attrs = self.doc.__class__.StreamedAttrs(self.attrs or ())
+                self.position = None
+
+    class TagFactory(object):
+        """
+        reusable tag, with its opening and closing strings rendered once
+        (see the `tag_factory` method)
+        """
+
+        __slots__ = (
+            'doc', 'name', 'static_attrs', 'opening', 'closing',
+            'parent_tag', 'position', '_attrs', '_delegates'
+        )
+
+        def __init__(self, doc, name, attrs):
+            # type: (SimpleDoc, str, Dict[str, Union[str, int, float]]) -> None
+            self.doc = doc
+            self.name = name
+            self.static_attrs = attrs
+            if attrs:
+                self.opening = "<%s %s>" % (name, dict_to_attrs(attrs))
+            else:
+                self.opening = "<%s>" % name
+            self.closing = "</%s>" % name
+            # state of the use in progress. If the factory is used again inside
+            # of itself, the inner uses are delegated to regular Tag instances.
+            self.parent_tag = None # type: Any
+            self.position = None # type: Any
+            self._attrs = None # type: Any
+            self._delegates = [] # type: List[Any]
+
+        @property
+        def attrs(self):
+            # type: () -> Dict[str, Any]
+            # only copied if the attributes of this particular use are modified
+            if self._attrs is None:
+                self._attrs = dict(self.static_attrs)
+            return self._attrs
+
+        def __enter__(self):
+            # type: () -> None
+            doc = self.doc
+            if self.parent_tag is not None:
+                delegate = doc.__class__.Tag(doc, self.name, dict(self.static_attrs))
+                self._delegates.append(delegate)
+                delegate.__enter__()
+                return
+            if doc._sink is not None:
+                doc._freeze_current_tag()
+            self.parent_tag = doc.current_tag
+            doc.current_tag = self
+            self.position = len(doc.result)
+            doc._append(self.opening)
+
+        def __exit__(self, tpe, value, traceback):
+            # type: (Any, Any, Any) -> None
+            if self._delegates:
+                self._delegates.pop().__exit__(tpe, value, traceback)
+                return
+            doc = self.doc
+            if value is None:
+                if self._attrs is not None and self.position is not None:
+                    doc.result[self.position] = self.render_opening()
+                doc._append(self.closing)
+                doc.current_tag = self.parent_tag
+            elif doc.current_tag is self:
+                # the block raised: the factory is left ready for the next use
+                doc.current_tag = self.parent_tag
+            self.parent_tag = self.position = self._attrs = None
+            if value is None and doc._flushing:
+                doc._flush()
+
+        def render_opening(self):
+            # type: () -> str
+            if self._attrs is None:
+                return self.opening
+            elif self._attrs:
+                return "<%s %s>" % (self.name, dict_to_attrs(self._attrs))
+            else:
+                return "<%s>" % self.name
+
+        def freeze(self):
+            # type: () -> None
+            if self.position is not None:
+                self.doc.result[self.position] = self.render_opening()
+                self._attrs = self.doc.__class__.StreamedAttrs(self.attrs)
+                self.position = None
+
+        def line(self, text_content):
+            # type: (Union[str, int, float]) -> None
+            """
+            appends the tag, containing the supplied text
+            """
+            self.doc._append(self.opening)
+            self.doc.text(text_content)
+            self.doc._append(self.closing)
+
+    class CachedFragment(object):
+        __slots__ = ('doc', 'key', 'cache', 'ttl', 'missed')
+
+        def __init__(self, doc, key, cache, ttl):
+            # type: (SimpleDoc, Any, Any, Any) -> None
+            self.doc = doc
+            self.key = key
+            self.cache = cache
+            self.ttl = ttl
+            self.missed = False
+
+        def __enter__(self):
+            # type: () -> bool
+            fragment = self.cache.get(self.key)
+            if fragment is None:
+                self.missed = True
+                self.doc._push_buffer()
+            else:
+                self.doc._append(fragment)
+            return self.missed
+
+        def __exit__(self, tpe, value, traceback):
+            # type: (Any, Any, Any) -> None
+            if self.missed:
+                fragment = ''.join(self.doc._pop_buffer())
+                if value is None:
+                    self.cache.set(self.key, fragment, self.ttl)
+                self.doc._append(fragment)
+
+    class CapturingTag(object):
+        """
+        base class for elements that need their whole inner content to render
+        themselves (see also the `capture` method).
+        What's appended to the document inside the `with` block goes to a
+        separate buffer. When the block is exited, the captured strings are
+        passed to the `consume` method, which by default appends the result of
+        `self.render(inner_content)` to the document.
+        Subclasses implement `render`, or `consume` if they need the captured
+        strings themselves.
+        """
+
+        __slots__ = ('doc', 'parent_tag', 'position')
+
+        def __init__(self, doc):
+            # type: (SimpleDoc) -> None
+            self.doc = doc
+
+        def __enter__(self):
+            # type: () -> Any
+            doc = self.doc
+            doc._push_buffer()
+            self.parent_tag = doc.current_tag
+            doc.current_tag = self
+            # nothing is left to patch in the document itself
+            self.position = None
+
+        def __exit__(self, tpe, value, traceback):
+            # type: (Any, Any, Any) -> None
+            doc = self.doc
+            captured = doc._pop_buffer()
+            doc.current_tag = self.parent_tag
+            if value is None:
+                self.consume(captured)
+                if doc._flushing:
+                    doc._flush()
+
+        def consume(self, captured):
+            # type: (List[Any]) -> None
+            self.doc._append(self.render(''.join(captured)))
+
+        def render(self, inner_content):
+            # type: (str) -> str
+            raise NotImplementedError
+
+    class Capture(CapturingTag):
+        __slots__ = ('render_function',)
+
+        def __init__(self, doc, render_function):
+            # type: (SimpleDoc, Callable[[str], str]) -> None
+            self.doc = doc
+            self.render_function = render_function
+
+        def render(self, inner_content):
+            # type: (str) -> str
+            return self.render_function(inner_content)
+
+    class StreamedAttrs(dict):
+        """
+        attributes of a tag whose opening was already handed over to the sink
+        (see the `sink` argument of the SimpleDoc constructor)
+        """
+
+        def _refuse(self, *args, **kwargs):
+            # type: (Any, Any) -> None
+            raise DocError(
+                "Can't modify the attributes of a tag once its content started "
+                "to be streamed. Set the attributes before opening any child tag."
+            )
+
+        __setitem__ = __delitem__ = update = pop = popitem = clear = setdefault = _refuse
 
     class DocumentRoot(object):
 
@@ -69,10 +285,13 @@ class SimpleDoc(object):
             # type: (str) -> Any
             raise SimpleDoc.DocumentRoot.DocumentRootError("DocumentRoot here. You can't access anything here.")
 
-    _newline_rgx = re.compile(r'\r?\n')
+    # in streaming mode, number of fragments appended between two attempts
+    # at handing over the finished part of the document to the sink
+    _flush_interval = 256
 
-    def __init__(self, stag_end = ' />', nl2br = False):
-        # type: (str, bool) -> None
+    def __init__(self, stag_end = ' />', nl2br = False, sink = None, chunk_size = 65536,
+     escape_memo = 0, text_filters = (), compact = False):
+        # type: (str, bool, Any, int, int, Any, bool) -> None
         r"""
             stag_end:
                 the string terminating self closing tags.
@@ -93,14 +312,72 @@ class SimpleDoc(object):
                 (see explanations about `stag_end` above).
                 Defaults to False (new lines are not replaced).
 
+            sink:
+                if set, the document is streamed instead of being kept in memory
+                until `getvalue` is called. The sink is either a file-like object
+                (anything with a `write` method) or a callable taking a string.
+                Finished parts of the document are written to it in chunks
+                of about `chunk_size` characters, so that memory usage doesn't
+                grow with the size of the document.
+                In that mode, the opening tag of an element is written as soon as
+                a child tag (or self closing tag) is opened inside of it, or once
+                a large amount of text was added to it, so its attributes must be set
+                before that (calling `attr`, `add_class`... afterwards raises a DocError).
+                Call the `flush` method once the document is complete.
+                Defaults to None (no streaming).
+
+            chunk_size:
+                the approximate size, in characters, of the strings passed to the sink,
+                or of the chunks kept in memory if `compact` is set.
+                Defaults to 65536.
+
+            escape_memo:
+                if set to a positive number, the `text` method remembers the escaped
+                version of up to that many short strings. Useful when the same values
+                (categories, statuses...) are repeated many times in a document.
+                Defaults to 0 (no memo).
+
+            text_filters:
+                a sequence of TextFilter instances applied by the `text` method
+                to the escaped strings, after the `nl2br` replacement if that
+                option is set. All the filters of the document are combined into
+                a single regular expression, so that each string is scanned only
+                once whatever the number of filters.
+                See `TextFilter` for an example.
+                Defaults to an empty tuple.
+
+            compact:
+                if set to True, finished parts of the document are regularly
+                joined into chunks of about `chunk_size` characters while the
+                document is built, instead of being kept as three or so small
+                strings per element. Only the parts that may still change
+                (opening tags of open elements, detached errors) stay separate.
+                This divides the memory used by very large documents several
+                times over, for a small cost in speed.
+                Defaults to False.
+
         """
         self.result = [] # type: List[str]
         self.current_tag = self.__class__.DocumentRoot() # type: Any
         self._append = self.result.append
         assert stag_end in (' />', '/>', '>')
         self._stag_end = stag_end
-        self._br = '<br' + stag_end
         self._nl2br = nl2br
+        self._sink = None # type: Any
+        if sink is not None:
+            self._sink = getattr(sink, 'write', sink)
+        self._chunk_size = chunk_size
+        # whether the document is flushed (or compacted) as elements are finished
+        self._flushing = sink is not None or compact
+        # start of the part of `result` that hasn't been compacted yet
+        self._compacted = 0
+        self._next_flush = self.__class__._flush_interval
+        self._buffers = [] # type: List[List[str]]
+        if nl2br:
+            text_filters = (nl2br_filter(stag_end),) + tuple(text_filters)
+        self._escape = compile_text_filters(text_filters) # type: Callable[[Any], str]
+        if escape_memo > 0:
+            self._escape = EscapeMemo(escape_memo, self._escape)
 
     def tag(self, tag_name, *args, **kwargs):
         # type: (str, Tuple[str, Union[str, int, float]], Union[str, int, float]) -> Tag
@@ -134,8 +411,34 @@ class SimpleDoc(object):
             # you get: <td data-search="lemon" data-order="1384" id="16">Citrus Limon</td>
 
         """
-        return self.__class__.Tag(self, tag_name, _attributes(args, kwargs))
+        return self.__class__.Tag(
+            self, tag_name, _attributes(args, kwargs) if args or kwargs else None
+        )
+
+
+    def tag_factory(self, tag_name, *args, **kwargs):
+        # type: (str, Tuple[str, Union[str, int, float]], Union[str, int, float]) -> TagFactory
+        """
+        returns a reusable tag, for the tags that are repeated many times
+        with the same attributes. The opening and closing strings of the tag
+        are rendered once, and then appended as they are each time it's used
+        in a `with` block.
+        The arguments are the same as for the `tag` method.
+        Calling `attr` (or `add_class` etc...) inside the `with` block still
+        works, it only affects that particular use of the tag.
+
+        Example::
 
+            td = doc.tag_factory('td', klass = 'num')
+            for row in rows:
+                with tag('tr'):
+                    for cell in row:
+                        with td:
+                            text(cell)
+                    td.line(sum(row)) # shortcut, like the `line` method
+
+        """
+        return self.__class__.TagFactory(self, tag_name, _attributes(args, kwargs))
 
     def text(self, *strgs):
         # type: (str) -> None
@@ -175,17 +478,11 @@ class SimpleDoc(object):
             'pistachio<br>ice cream'
 
         """
+        escape = self._escape
         for strg in strgs:
-            transformed_string = html_escape(strg)
-            if self._nl2br:
-                self._append(
-                    self.__class__._newline_rgx.sub(
-                        self._br,
-                        transformed_string
-                    )
-                )
-            else:
-                self._append(transformed_string)
+            self._append(escape(strg))
+        if self._flushing:
+            self._check_flush()
 
     def line(self, tag_name, text_content, *args, **kwargs):
         # type: (str, str, Tuple[str, Union[str, int, float]], Union[str, int, float]) -> None
@@ -217,8 +514,91 @@ class SimpleDoc(object):
 
             <a href="/about-us.html">Who are we?</a>
         """
-        with self.tag(tag_name, *args, **kwargs):
-            self.text(text_content)
+        # no Tag instance needed here: the attributes can't change
+        if self._sink is not None:
+            self._freeze_current_tag()
+        if args or kwargs:
+            self._append("<%s %s>" % (tag_name, dict_to_attrs(_attributes(args, kwargs))))
+        else:
+            self._append("<%s>" % tag_name)
+        self.text(text_content)
+        self._append("</%s>" % tag_name)
+        if self._flushing:
+            self._flush()
+
+    def lines(self, tag_name, text_contents, *args, **kwargs):
+        # type: (str, Iterable[Union[str, int, float]], Tuple[str, Union[str, int, float]], Union[str, int, float]) -> None
+        """
+        appends one tag node per item of `text_contents`, each one containing
+        the text of the item. The optional arguments after that are interpreted
+        as xml/html attributes shared by all the nodes, in the same way as with
+        the `tag` method.
+
+        Example::
+
+            lines('li', ['Tomato sauce', 'Salt', 'Pepper'], klass = 'ingredient')
+
+        produces::
+
+            <li class="ingredient">Tomato sauce</li><li class="ingredient">Salt</li><li class="ingredient">Pepper</li>
+
+        This is equivalent to calling `line` for each item, but faster
+        since the opening and closing tags are only built once.
+        """
+        if args or kwargs:
+            opening = "<%s %s>" % (tag_name, dict_to_attrs(_attributes(args, kwargs)))
+        else:
+            opening = "<%s>" % tag_name
+        closing = "</%s>" % tag_name
+        escape = self._escape
+        if self._sink is not None:
+            self._freeze_current_tag()
+        self.result.extend([
+            opening + escape(text_content) + closing
+            for text_content in text_contents
+        ])
+        if self._flushing:
+            self._flush()
+
+    def stags(self, tag_name, attrs_list, *args, **kwargs):
+        # type: (str, Iterable[Optional[Dict[str, Any]]], Tuple[str, Union[str, int, float]], Union[str, int, float]) -> None
+        """
+        appends one self closing tag per item of `attrs_list`.
+        Each item is a dictionary of attributes specific to that tag
+        (use the 'class' key, not 'klass') or None.
+        The optional arguments after that are interpreted as xml/html attributes
+        shared by all the tags, in the same way as with the `stag` method.
+
+        Example::
+
+            stags('img', [{'src': 'a.png'}, {'src': 'b.png'}], klass = 'thumbnail')
+
+        produces::
+
+            <img class="thumbnail" src="a.png" /><img class="thumbnail" src="b.png" />
+        """
+        shared_attrs = _attributes(args, kwargs) if args or kwargs else {}
+        if shared_attrs:
+            opening = "<%s %s" % (tag_name, dict_to_attrs(shared_attrs))
+        else:
+            opening = "<%s" % tag_name
+        stag_end = self._stag_end
+        if self._sink is not None:
+            self._freeze_current_tag()
+        fragments = []
+        append = fragments.append
+        for attrs in attrs_list:
+            if not attrs:
+                append(opening + stag_end)
+            elif shared_attrs and not shared_attrs.keys().isdisjoint(attrs):
+                merged_attrs = dict(shared_attrs)
+                merged_attrs.update(attrs)
+                append("<%s %s%s" % (tag_name, dict_to_attrs(merged_attrs), stag_end))
+            else:
+                append("%s %s%s" % (opening, dict_to_attrs(attrs), stag_end))
+        self.result.extend(fragments)
+        if self._flushing:
+            self._flush()
 
     def asis(self, *strgs):
         # type: (str) -> None
@@ -237,10 +617,14 @@ class SimpleDoc(object):
                 # passing None by mistake was frequent enough to justify a check
                 # see https://github.com/leforestier/yattag/issues/20
             self._append(strg)
+        if self._flushing:
+            self._check_flush()
 
     def nl(self):
         # type: () -> None
         self._append('\n')
+        if self._flushing:
+            self._check_flush()
 
     def attr(self, *args, **kwargs):
         # type: (Tuple[str, Union[str, int, float]], Union[str, int, float]) -> None
@@ -278,7 +662,7 @@ class SimpleDoc(object):
             # you get: <td data-search="lemon" data-order="1384">Citrus Limon</td>
 
         """
-        self.current_tag.attrs.update(_attributes(args, kwargs))
+        self._current_attrs().update(_attributes(args, kwargs))
 
     def data(self, *args, **kwargs):
         # type: (Tuple[str, Union[str, int, float]], Union[str, int, float]) -> None
@@ -342,6 +726,8 @@ class SimpleDoc(object):
             >>> doc.getvalue()
             '<br>'
         """
+        if self._sink is not None:
+            self._freeze_current_tag()
         if args or kwargs:
             self._append("<%s %s%s" % (
                 tag_name,
@@ -350,6 +736,8 @@ class SimpleDoc(object):
             ))
         else:
             self._append("<%s%s" % (tag_name, self._stag_end))
+        if self._flushing:
+            self._check_flush()
 
     def cdata(self, strg, safe = False):
         # type: (str, bool) -> None
@@ -368,13 +756,299 @@ class SimpleDoc(object):
         else:
             self._append(strg.replace(']]>', ']]]]><![CDATA[>'))
         self._append(']]>')
+        if self._flushing:
+            self._check_flush()
+
+    def cached(self, key, cache, ttl = None):
+        # type: (Any, Any, Any) -> SimpleDoc.CachedFragment
+        """
+        caches the part of the document produced inside of a `with` block
+
+        key:
+            a hashable value identifying the fragment in the cache
+        cache:
+            where the fragment is stored, usually a yattag.cache.LRUCache instance
+            shared between documents
+        ttl:
+            optional time to live of the fragment, in seconds
+
+        The `with` statement evaluates to True if the fragment is missing
+        from the cache and must be rendered. Otherwise the cached fragment is
+        appended to the document, and the block should do nothing.
+
+        Example::
+
+            footer_cache = LRUCache(maxsize = 100)
+
+            with doc.cached(('footer', lang), footer_cache, ttl = 3600) as missed:
+                if missed:
+                    with tag('footer'):
+                        text(translations[lang]['copyright'])
+        """
+        return self.__class__.CachedFragment(self, key, cache, ttl)
+
+    def capture(self, render_function):
+        # type: (Callable[[str], str]) -> SimpleDoc.Capture
+        """
+        returns a context manager for wrapper elements that need their inner
+        content as a string. What's appended to the document inside of the
+        `with` block is captured, and on exit `render_function` is called with
+        it. The string it returns is appended to the document instead.
+
+        Example::
+
+            def card(inner_content):
+                return '<div class="card" data-length="%d">%s</div>' % (
+                    len(inner_content), inner_content
+                )
+
+            with doc.capture(card):
+                line('p', 'Hello')
+
+        For reusable elements, subclass SimpleDoc.CapturingTag instead.
+        """
+        return self.__class__.Capture(self, render_function)
 
     def getvalue(self):
         # type: () -> str
         """
         returns the whole document as a single string
         """
-        return ''.join(self.result)
+        result = self._finished_result()
+        if len(result) == 1:
+            return result[0]
+        return ''.join(result)
+
+    def iterencode(self, encoding = 'utf-8', chunk_size = None):
+        # type: (str, Optional[int]) -> Iterator[bytes]
+        """
+        returns an iterator over the document encoded with `encoding`, in
+        chunks of about `chunk_size` characters (defaults to the `chunk_size`
+        argument of the constructor). Unlike `getvalue().encode(encoding)`,
+        neither the whole document as a string nor the whole encoded
+        document are built: the chunks are cut from the parts the document
+        is made of.
+        """
+        self._prepare_output()
+        return self._iterencode(self.result, encoding, chunk_size or self._chunk_size)
+
+    def getbuffers(self, encoding = 'utf-8', chunk_size = None):
+        # type: (str, Optional[int]) -> List[bytes]
+        """
+        returns the encoded document as a list of bytes objects of about
+        `chunk_size` characters each, that can be passed as such to
+        `os.writev` or `socket.sendmsg`.
+        """
+        return list(self.iterencode(encoding, chunk_size))
+
+    def write_to(self, fileobj, encoding = 'utf-8', chunk_size = None):
+        # type: (Any, str, Optional[int]) -> int
+        """
+        writes the encoded document to `fileobj`, a binary file-like object,
+        one chunk at a time (see `iterencode`). Returns the number of bytes written.
+        """
+        write = fileobj.write
+        written = 0
+        for chunk in self.iterencode(encoding, chunk_size):
+            write(chunk)
+            written += len(chunk)
+        return written
+
+    @staticmethod
+    def _iterencode(result, encoding, chunk_size):
+        # type: (List[str], str, int) -> Iterator[bytes]
+        # an incremental encoder, so that encodings with a state (BOM of
+        # utf-16 and utf-8-sig...) produce the same bytes as str.encode
+        encode = codecs.getincrementalencoder(encoding)().encode
+        pending = [] # type: List[str]
+        pending_size = 0
+        for strg in result:
+            size = len(strg)
+            if pending_size + size < chunk_size:
+                pending.append(strg)
+                pending_size += size
+                continue
+            # large parts are sliced, never concatenated, so that no copy
+            # of them is made
+            start = 0
+            if pending:
+                start = chunk_size - pending_size
+                pending.append(strg[:start])
+                yield encode(''.join(pending))
+                pending = []
+                pending_size = 0
+            end = size - (size - start) % chunk_size
+            for position in range(start, end, chunk_size):
+                yield encode(strg[position:position + chunk_size])
+            if end < size:
+                pending.append(strg[end:])
+                pending_size = size - end
+        last = encode(''.join(pending), True)
+        if last:
+            yield last
+
+    def _finished_result(self):
+        # type: () -> List[str]
+        # the result list, coalesced, once checked that the document can be output
+        self._prepare_output()
+        self._coalesce()
+        self._compacted = len(self.result)
+        return self.result
+
+    def _prepare_output(self):
+        # type: () -> None
+        # checks that the document can be output
+        if self._buffers:
+            raise DocError("Can't get the value of the document while capturing a fragment.")
+        if self._sink is not None:
+            raise DocError(
+                "This document is streamed to a sink. Call `flush` instead of `getvalue`."
+            )
+
+    def _pinned_positions(self):
+        # type: () -> List[int]
+        # positions in `result` that may still be replaced
+        return [tag.position for tag in self._open_tags() if tag.position is not None]
+
+    def _move_positions(self, moves):
+        # type: (Dict[int, int]) -> None
+        # updates what refers to pinned positions after `result` was coalesced
+        for tag in self._open_tags():
+            if tag.position is not None:
+                tag.position = moves.get(tag.position, tag.position)
+
+    def _coalesce(self, start = 0):
+        # type: (int) -> None
+        # joins each run of strings that can't change anymore, from `start` on,
+        # into a single string, so that the next calls to getvalue only join
+        # what was appended since
+        result = self.result
+        pinned = sorted(set(
+            position for position in self._pinned_positions() if position >= start
+        ))
+        if len(result) - start <= 2 * len(pinned) + 1:
+            return
+        coalesced = [] # type: List[str]
+        moves = {} # type: Dict[int, int]
+        offset = start
+        for position in pinned:
+            if position > offset:
+                coalesced.append(''.join(result[offset:position]))
+            moves[position] = start + len(coalesced)
+            coalesced.append(result[position])
+            offset = position + 1
+        if offset < len(result):
+            coalesced.append(''.join(result[offset:]))
+        result[start:] = coalesced
+        if moves:
+            self._move_positions(moves)
+
+    def _compact(self):
+        # type: () -> None
+        # `compact` mode: coalesces what was appended since the previous call.
+        # The last chunk is coalesced again with what follows until it reaches
+        # the chunk size.
+        self._coalesce(self._compacted)
+        result = self.result
+        pinned = self._pinned_positions()
+        last = len(result) - 1
+        if last >= 0 and last not in pinned and len(result[last]) < self._chunk_size:
+            self._compacted = last
+        else:
+            self._compacted = len(result)
+
+    def flush(self):
+        # type: () -> None
+        """
+        in streaming mode (see the `sink` argument of the constructor),
+        writes everything that can't change anymore to the sink, regardless of
+        the chunk size. Call it once the document is complete.
+        """
+        if self._sink is None:
+            raise DocError("This document has no sink to flush to.")
+        self._flush(force = True)
+
+    def _push_buffer(self):
+        # type: () -> None
+        # what is appended to the document is diverted to a new buffer
+        # until the matching _pop_buffer call
+        if self._sink is not None:
+            self._freeze_current_tag()
+        self._buffers.append(self.result)
+        self.result = []
+        self._append = self.result.append
+
+    def _pop_buffer(self):
+        # type: () -> List[str]
+        captured = self.result
+        self.result = self._buffers.pop()
+        self._append = self.result.append
+        return captured
+
+    def _open_tags(self):
+        # type: () -> List[Any]
+        tags = []
+        tag = self.current_tag
+        while not isinstance(tag, SimpleDoc.DocumentRoot):
+            tags.append(tag)
+            tag = tag.parent_tag
+        return tags
+
+    def _freeze_current_tag(self):
+        # type: () -> None
+        # streaming mode: a child tag is being opened, so the opening tag
+        # of the current one is rendered now and won't be patched later
+        tag = self.current_tag
+        if isinstance(tag, (SimpleDoc.Tag, SimpleDoc.TagFactory)):
+            tag.freeze()
+
+    def _check_flush(self):
+        # type: () -> None
+        # streaming or compact mode, after content was appended inside of the
+        # current tag (text, self closing tag...). When streaming, the current
+        # tag is only frozen if a flush is due, so that its attributes can still
+        # be set after some text. When compacting, tags opened recently are left
+        # to the flush done when they're closed: compacting around their
+        # placeholder would leave small strings behind.
+        result = self.result
+        if len(result) < self._next_flush or self._buffers:
+            return
+        if self._sink is not None:
+            self._freeze_current_tag()
+        else:
+            position = getattr(self.current_tag, 'position', None)
+            if position is not None and position > len(result) - self.__class__._flush_interval:
+                return
+        self._flush()
+
+    def _flush(self, force = False):
+        # type: (bool) -> None
+        result = self.result
+        if self._buffers or (not force and len(result) < self._next_flush):
+            return
+        if self._sink is None:
+            self._compact()
+            self._next_flush = len(result) + self.__class__._flush_interval
+            return
+        open_tags = self._open_tags()
+        limit = len(result)
+        for tag in open_tags:
+            if tag.position is not None and tag.position < limit:
+                limit = tag.position
+        if limit:
+            chunk = ''.join(result[:limit])
+            if force or len(chunk) >= self._chunk_size:
+                self._sink(chunk)
+                del result[:limit]
+                shift = limit
+            else:
+                result[:limit] = [chunk]
+                shift = limit - 1
+            if shift:
+                for tag in open_tags:
+                    if tag.position is not None:
+                        tag.position -= shift
+        self._next_flush = len(result) + self.__class__._flush_interval
 
     def tagtext(self):
         # type: () -> Tuple[SimpleDoc, Any, Any]
@@ -466,23 +1140,42 @@ class SimpleDoc(object):
         # type: () -> Set[str]
         try:
             current_classes = self.current_tag.attrs['class']
-        except KeyError:
+        except (KeyError, TypeError): # TypeError: the tag has no attributes (None)
             return set()
         else:
             return set(current_classes.split())
 
     def _set_classes(self, classes_set):
         # type: (Set[str]) -> None
+        if classes_set == self._get_classes():
+            # nothing to change (the attributes of a streamed tag can't be changed)
+            return
         if classes_set:
-            self.current_tag.attrs['class'] = ' '.join(classes_set)
+            self._current_attrs()['class'] = ' '.join(classes_set)
         else:
             try:
                 del self.current_tag.attrs['class']
-            except KeyError:
+            except (KeyError, TypeError):
                 pass
 
+    def _current_attrs(self):
+        # type: () -> Dict[str, Any]
+        tag = self.current_tag
+        if tag.attrs is None:
+            tag.attrs = {}
+        return tag.attrs
+
 def html_escape(s):
     # type: (Union[str, int, float]) -> str
+    if type(s) is str:
+        # most strings don't contain any special character: they're returned as is
+        if '&' in s:
+            s = s.replace("&", "&amp;")
+        if '<' in s:
+            s = s.replace("<", "&lt;")
+        if '>' in s:
+            s = s.replace(">", "&gt;")
+        return s
     if isinstance(s,(int,float)):
         return str(s)
     try:
@@ -494,6 +1187,151 @@ def html_escape(s):
         )
 
 
+class EscapeMemo(object):
+    """
+    bounded memo of escaped strings, for documents where the same short
+    strings (labels, statuses...) are inserted over and over
+    (see the `escape_memo` argument of the SimpleDoc constructor)
+    """
+
+    # longer strings are escaped every time, they are unlikely to repeat
+    max_length = 128
+
+    def __init__(self, size, escape = html_escape):
+        # type: (int, Callable[[Any], str]) -> None
+        self.size = size
+        self.escape = escape
+        self.values = {} # type: Dict[str, str]
+
+    def __call__(self, s):
+        # type: (Any) -> str
+        try:
+            result = self.values.get(s)
+        except TypeError: # unhashable
+            return self.escape(s)
+        if result is not None:
+            return result
+        result = self.escape(s)
+        # only exact strings are stored, since 1, 1.0 and True are equal dictionary keys
+        if type(s) is str and len(s) <= self.__class__.max_length:
+            values = self.values
+            if len(values) >= self.size:
+                values.clear()
+            values[s] = result
+        return result
+
+
+class TextFilter(object):
+    r"""
+    replacement applied to the escaped text inserted by the `text` method
+    (see the `text_filters` argument of the SimpleDoc constructor)
+
+    pattern:
+        regular expression (as a string) searched in the escaped text.
+        Since the filters of a document are combined into one regular expression,
+        it shouldn't contain numbered backreferences.
+    replacement:
+        string replacing each match, or function taking the match object and
+        returning the replacement. Replacements are inserted as they are.
+    flags:
+        flags of the pattern (re.I, re.M, re.S or re.X), applied to this
+        pattern only
+
+    Example::
+
+        mentions = TextFilter(
+            r'@(?P<user>\w+)',
+            lambda match: '<a href="/users/%s">@%s</a>' % ((match.group('user'),) * 2)
+        )
+        doc = SimpleDoc(nl2br = True, text_filters = [mentions, collapse_whitespace_filter()])
+        doc.text('Hi   @max,\nthanks!')
+        doc.getvalue() # 'Hi <a href="/users/max">@max</a>,<br />thanks!'
+    """
+
+    def __init__(self, pattern, replacement, flags = 0):
+        # type: (str, Union[str, Callable[[Any], str]], int) -> None
+        self.pattern = pattern
+        self.replacement = replacement
+        self.flags = flags
+
+def nl2br_filter(stag_end = ' />'):
+    # type: (str) -> TextFilter
+    r"""new lines ('\n' or '\r\n' sequences) become <br /> tags"""
+    return TextFilter(r'\r?\n', '<br' + stag_end)
+
+def collapse_whitespace_filter(keep_newlines = True):
+    # type: (bool) -> TextFilter
+    """
+    sequences of whitespace characters become a single space.
+    If keep_newlines is True, new lines are left untouched (so that they can
+    still be handled by the nl2br option).
+    """
+    return TextFilter(r'[^\S\r\n]+' if keep_newlines else r'\s+', ' ')
+
+def compile_text_filters(text_filters, escape = html_escape):
+    # type: (Any, Callable[[Any], str]) -> Callable[[Any], str]
+    """
+    returns a function escaping its argument with `escape`, then applying
+    all the `text_filters` in a single scan of the string
+    """
+    if not text_filters:
+        return escape
+    if len(text_filters) == 1:
+        pattern = re.compile(text_filters[0].pattern, text_filters[0].flags)
+        replacement = text_filters[0].replacement # type: Any
+        if isinstance(replacement, str):
+            # replacement templates are processed once by the re module
+            replacement = replacement.replace('\\', r'\\')
+    else:
+        pattern = re.compile('|'.join(
+            '(?P<_f%d>(?%s:%s))' % (
+                i,
+                ''.join(
+                    letter for flag, letter in (
+                        (re.I, 'i'), (re.M, 'm'), (re.S, 's'), (re.X, 'x')
+                    ) if text_filter.flags & flag
+                ),
+                text_filter.pattern
+            )
+            for i, text_filter in enumerate(text_filters)
+        ))
+        replacement = _FilterReplacement(dict(
+            ('_f%d' % i, text_filter.replacement)
+            for i, text_filter in enumerate(text_filters)
+        ))
+    return _TextFilters(pattern, replacement, escape)
+
+# The two classes below are used instead of closures so that documents
+# with text filters can still be pickled.
+
+class _FilterReplacement(object):
+    # replacement function of several filters combined in one pattern
+    __slots__ = ('replacements',)
+
+    def __init__(self, replacements):
+        # type: (Dict[str, Any]) -> None
+        self.replacements = replacements
+
+    def __call__(self, match):
+        # type: (Any) -> str
+        result = self.replacements[match.lastgroup]
+        return result if isinstance(result, str) else result(match)
+
+class _TextFilters(object):
+    # escaping function returned by compile_text_filters
+    __slots__ = ('pattern', 'replacement', 'escape')
+
+    def __init__(self, pattern, replacement, escape):
+        # type: (Any, Any, Callable[[Any], str]) -> None
+        self.pattern = pattern
+        self.replacement = replacement
+        self.escape = escape
+
+    def __call__(self, s):
+        # type: (Any) -> str
+        return self.pattern.sub(self.replacement, self.escape(s))
+
+
 class AsIs:
     def __init__(self, value):
         self._value = value
@@ -504,6 +1342,14 @@ class AsIs:
 
 def attr_escape(s):
     # type: (Union[str, int, float]) -> str
+    if type(s) is str:
+        if '&' in s:
+            s = s.replace("&", "&amp;")
+        if '<' in s:
+            s = s.replace("<", "&lt;")
+        if '"' in s:
+            s = s.replace('"', "&quot;")
+        return s
     if isinstance(s,(int,float)):
         return str(s)
     try:
@@ -534,7 +1380,36 @@ def format_attr_value(value):
 
 ATTR_NO_VALUE = object()
 
+# serialized attributes, keyed by the tuple of their (key, value) pairs.
+# Only sets of attributes whose values are all exact strings are stored:
+# 1, 1.0 and True are equal keys but are not serialized the same way.
+_attrs_cache = {} # type: Dict[Tuple[Any, ...], str]
+_attrs_cache_size = 4096
+# longer serializations (data URIs, JSON...) aren't stored, they are
+# unlikely to repeat and would be kept twice (in the key and the value)
+_attrs_cache_max_length = 256
+
 def dict_to_attrs(dct):
+    # type: (Dict[str, Any]) -> str
+    key = tuple(dct.items())
+    try:
+        result = _attrs_cache.get(key)
+    except TypeError: # unhashable value
+        return _serialize_attrs(dct)
+    if result is None:
+        result = _serialize_attrs(dct)
+        if len(result) > _attrs_cache_max_length:
+            return result
+        for value in dct.values():
+            if type(value) is not str and value is not ATTR_NO_VALUE:
+                break
+        else:
+            if len(_attrs_cache) >= _attrs_cache_size:
+                _attrs_cache.clear()
+            _attrs_cache[key] = result
+    return result
+
+def _serialize_attrs(dct):
     # type: (Dict[str, Any]) -> str
     return ' '.join(
         (key if value is ATTR_NO_VALUE
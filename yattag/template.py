@@ -0,0 +1,469 @@
+"""
+Templates recorded once and replayed many times.
+
+A Template runs a render function a single time, with placeholders (slots)
+in place of the variable data, and keeps the result as a list of static
+strings with holes. Rendering the template with actual values only escapes
+the values and joins the strings: tags and attributes are not built again.
+
+Example::
+
+    from yattag import Template
+
+    def product_card(doc, name, price, url):
+        with doc.tag('div', klass = 'card'):
+            with doc.tag('a', href = url):
+                doc.text(name)
+            doc.line('span', price, klass = 'price')
+
+    card = Template(product_card, 'name', 'price', 'url')
+    card.render(name = 'Fish & chips', price = '9.50', url = '/fish')
+    # <div class="card"><a href="/fish">Fish &amp; chips</a><span class="price">9.50</span></div>
+
+Slots can be used as text (with `text`, `line`, as items of `lines`...), as attribute values,
+with `asis` (in which case the value is inserted without escaping) or with `cdata`.
+They must be passed as they are: the structure of the document can't depend
+on them, and they can't be concatenated with other strings (except in
+attribute values): `text` and `cdata` raise a DocError if they are.
+
+A FormTemplate does the same for html forms built with the `input`,
+`textarea`, `select` and `option` methods of Doc: the form is recorded once,
+and then rendered with different defaults and errors::
+
+    from yattag import FormTemplate
+
+    def signup_form(doc):
+        with doc.tag('form', action = '/signup', method = 'post'):
+            doc.input(name = 'email', type = 'email', klass = 'wide')
+            with doc.select(name = 'country'):
+                for code, label in countries:
+                    with doc.option(value = code):
+                        doc.text(label)
+            doc.stag('input', type = 'submit', value = 'Sign up')
+
+    form = FormTemplate(signup_form)
+    form.render(defaults = {'country': 'FR'}, errors = {'email': 'Invalid email'})
+
+Only the parts that depend on the defaults and errors (value and checked
+attributes, selected options, error messages and classes) are computed at
+rendering time, using strings prepared during the recording.
+"""
+
+import re
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from yattag.simpledoc import SimpleDoc, DocError, html_escape, attr_escape
+from yattag.doc import Doc, IndexedDefaults
+
+__all__ = ['Template', 'FormTemplate']
+
+# kinds of slots, as they appear in the recorded output
+_TEXT = 'T'
+_ATTR = 'A'
+_ASIS = 'R'
+_CDATA = 'C'
+
+_slot_rgx = re.compile('\x00([%s%s%s%s])(\\d+)\x00' % (_TEXT, _ATTR, _ASIS, _CDATA))
+
+class Slot(str):
+    """
+    placeholder passed to the render function of a Template while recording
+    it. Its string value is what ends up in attribute values.
+    """
+
+    def __new__(cls, index, name):
+        # type: (int, str) -> Slot
+        slot = str.__new__(cls, '\x00%s%d\x00' % (_ATTR, index))
+        slot.index = index
+        slot.name = name
+        return slot
+
+    def marker(self, kind):
+        # type: (str) -> str
+        return '\x00%s%d\x00' % (kind, self.index)
+
+def _check_no_slot(strg):
+    # type: (Any) -> None
+    # a slot concatenated with other strings would be filled in as an attribute value
+    if isinstance(strg, str) and _slot_rgx.search(strg):
+        raise DocError(
+            "Slots can't be concatenated with other strings, except in attribute values."
+        )
+
+def _cdata_escape(value):
+    # type: (Any) -> str
+    return str(value).replace(']]>', ']]]]><![CDATA[>')
+
+def _recorder_class(doc_class):
+    # type: (Any) -> Any
+
+    class Recorder(doc_class): # type: ignore
+
+        def __init__(self, *args, **kwargs):
+            # type: (Any, Any) -> None
+            super(Recorder, self).__init__(*args, **kwargs)
+            # everything escaped as text (`text`, `line`, `lines`, option
+            # labels...) goes through `_escape`: slots are recorded there
+            self._text_escape = self._escape
+            self._escape = self._record_escape
+
+        def _record_escape(self, strg):
+            # type: (Any) -> str
+            if isinstance(strg, Slot):
+                return strg.marker(_TEXT)
+            _check_no_slot(strg)
+            return self._text_escape(strg)
+
+        def asis(self, *strgs):
+            # type: (Any) -> None
+            for strg in strgs:
+                if isinstance(strg, Slot):
+                    self._append(strg.marker(_ASIS))
+                else:
+                    super(Recorder, self).asis(strg)
+
+        def cdata(self, strg, safe = False):
+            # type: (Any, bool) -> None
+            if isinstance(strg, Slot):
+                self._append('<![CDATA[')
+                self._append(strg.marker(_ASIS if safe else _CDATA))
+                self._append(']]>')
+            else:
+                _check_no_slot(strg)
+                super(Recorder, self).cdata(strg, safe)
+
+    return Recorder
+
+class Template(object):
+    """
+    records `render_function` once and renders it again with different values
+
+    render_function:
+        a function taking a document as first argument, and one keyword
+        argument per slot name.
+
+    slot_names:
+        the names of the variable parts of the template.
+
+    doc_class:
+        the class of the document used for the recording (defaults to SimpleDoc).
+        Additional keyword arguments (like `stag_end` or `nl2br`) are
+        passed to its constructor.
+    """
+
+    def __init__(self, render_function, *slot_names, **kwargs):
+        # type: (Callable[..., Any], str, Any) -> None
+        doc_class = kwargs.pop('doc_class', SimpleDoc)
+        doc = _recorder_class(doc_class)(**kwargs)
+        slots = [Slot(i, name) for i, name in enumerate(slot_names)]
+        render_function(doc, **dict((slot.name, slot) for slot in slots))
+
+        escape_functions = {
+            _TEXT: doc._text_escape,
+            _ATTR: attr_escape,
+            _ASIS: str,
+            _CDATA: _cdata_escape,
+        } # type: Dict[str, Callable[[Any], str]]
+
+        pieces = _slot_rgx.split(doc.getvalue())
+        self.slot_names = slot_names
+        self._parts = [] # type: List[str]
+        self._slots = [] # type: List[Tuple[int, Callable[[Any], str], str]]
+        for i in range(0, len(pieces) - 1, 3):
+            static, kind, index = pieces[i:i+3]
+            if static:
+                self._parts.append(static)
+            self._slots.append(
+                (len(self._parts), escape_functions[kind], slot_names[int(index)])
+            )
+            self._parts.append('')
+        if pieces[-1]:
+            self._parts.append(pieces[-1])
+
+    def _fill(self, values):
+        # type: (Dict[str, Any]) -> List[str]
+        parts = self._parts[:]
+        for position, escape, name in self._slots:
+            parts[position] = escape(values[name])
+        return parts
+
+    def render(self, **values):
+        # type: (Any) -> str
+        """
+        returns the template rendered with the given slot values
+        """
+        return ''.join(self._fill(values))
+
+    def append_to(self, doc, **values):
+        # type: (SimpleDoc, Any) -> None
+        """
+        appends the template rendered with the given slot values to `doc`
+        """
+        doc.result.extend(self._fill(values))
+
+
+# markers standing for the error message and the default value of a form
+# element while preparing its variants
+_ERROR = '\x00E\x00'
+_VALUE = '\x00V\x00'
+
+_marker_rgx = re.compile('(\x00[EV]\x00)')
+
+class FormHook(object):
+    """
+    part of a FormTemplate that depends on the defaults and errors.
+    The element (input, option...) is rendered once for each possible
+    combination of conditions (error or not, default value or not...) with
+    markers in place of the error message and default value. The
+    `key` method tells which combination applies to the given defaults and errors.
+    The defaults are given as an IndexedDefaults instance, as for the
+    form elements of Doc.
+    """
+
+    def __init__(self, element, render_function, keys):
+        # type: (Any, Callable[..., str], Any) -> None
+        self.element = element
+        self.name = element.name
+        self.variants = {} # type: Dict[Any, Any]
+        for key in keys:
+            try:
+                self.variants[key] = _marker_rgx.split(render_function(key))
+            except DocError as e:
+                self.variants[key] = e
+
+    def key(self, defaults, errors):
+        # type: (Dict[str, Any], Dict[str, Any]) -> Any
+        raise NotImplementedError
+
+    def render(self, defaults, errors):
+        # type: (Dict[str, Any], Dict[str, Any]) -> str
+        key = self.key(defaults, errors)
+        pieces = self.variants[key]
+        if isinstance(pieces, DocError):
+            raise DocError(*pieces.args)
+        if len(pieces) == 1:
+            return pieces[0]
+        pieces = pieces[:]
+        for i in range(1, len(pieces), 2):
+            if pieces[i] == _ERROR:
+                pieces[i] = html_escape(errors[self.name])
+            else:
+                # the value itself, not the set IndexedDefaults may have built
+                pieces[i] = self.escape_default(defaults.defaults[self.name])
+        return ''.join(pieces)
+
+    def escape_default(self, value):
+        # type: (Any) -> str
+        return attr_escape(str(value))
+
+# keys: (has error, has default value) or (has error, checked)
+_PAIRS = ((False, False), (False, True), (True, False), (True, True))
+
+def _defaults_errors(key, name):
+    # type: (Tuple[bool, bool], str) -> Tuple[Dict[str, str], Dict[str, str]]
+    has_error, has_default = key
+    return (
+        {name: _VALUE} if has_default else {},
+        {name: _ERROR} if has_error else {}
+    )
+
+class SimpleInputHook(FormHook):
+
+    def key(self, defaults, errors):
+        # type: (Dict[str, Any], Dict[str, Any]) -> Any
+        return (self.name in errors, self.name in defaults)
+
+class CheckableInputHook(FormHook):
+
+    def key(self, defaults, errors):
+        # type: (Dict[str, Any], Dict[str, Any]) -> Any
+        return (self.element.rank == 0 and self.name in errors, self.element.checked(defaults))
+
+class TextareaHook(FormHook):
+
+    def key(self, defaults, errors):
+        # type: (Dict[str, Any], Dict[str, Any]) -> Any
+        return (self.name in errors, self.name in defaults)
+
+    def escape_default(self, value):
+        # type: (Any) -> str
+        return html_escape(str(value))
+
+class SelectHook(FormHook):
+    """opening of a <select> tag, the options being separate parts of the template"""
+
+    def key(self, defaults, errors):
+        # type: (Dict[str, Any], Dict[str, Any]) -> Any
+        return self.name in errors
+
+class OptionHook(FormHook):
+
+    def key(self, defaults, errors):
+        # type: (Dict[str, Any], Dict[str, Any]) -> Any
+        return self.element.selected(defaults)
+
+class DetachedErrorsHook(object):
+
+    def __init__(self, render_function, fields):
+        # type: (Callable[[Dict[str, str]], str], Any) -> None
+        self.render_function = render_function
+        self.fields = fields
+
+    def render(self, defaults, errors):
+        # type: (Dict[str, Any], Dict[str, Any]) -> str
+        return self.render_function(
+            dict((name, errors[name]) for name in errors if name not in self.fields)
+        )
+
+def _form_recorder_class(doc_class):
+    # type: (Any) -> Any
+    # The form elements of the recorder return FormHook instances instead of strings,
+    # and these hooks end up in the `result` list of the document.
+
+    def checkable_input_class(base_class):
+        # type: (Any) -> Any
+
+        class RecordedCheckableInput(base_class): # type: ignore
+            def render(self, defaults, errors, error_wrapper, stag_end = ' />'):
+                # type: (Any, Any, Any, str) -> Any
+                def render_function(key):
+                    # type: (Tuple[bool, bool]) -> str
+                    has_error, checked = key
+                    self.checked = lambda defaults: checked
+                    try:
+                        return base_class.render(
+                            self, {}, {self.name: _ERROR} if has_error else {},
+                            error_wrapper, stag_end
+                        )
+                    finally:
+                        del self.checked
+                return CheckableInputHook(self, render_function, _PAIRS)
+
+        return RecordedCheckableInput
+
+    class FormRecorder(doc_class): # type: ignore
+
+        class SimpleInput(doc_class.SimpleInput): # type: ignore
+            def render(self, defaults, errors, error_wrapper, stag_end = ' />'):
+                # type: (Any, Any, Any, str) -> Any
+                return SimpleInputHook(
+                    self,
+                    lambda key: doc_class.SimpleInput.render(
+                        self, *_defaults_errors(key, self.name),
+                        error_wrapper = error_wrapper, stag_end = stag_end
+                    ),
+                    _PAIRS
+                )
+
+        CheckboxInput = checkable_input_class(doc_class.CheckboxInput)
+        RadioInput = checkable_input_class(doc_class.RadioInput)
+
+        class Textarea(doc_class.Textarea): # type: ignore
+            def render(self, defaults, errors, error_wrapper, inner_content = ''):
+                # type: (Any, Any, Any, str) -> Any
+                return TextareaHook(
+                    self,
+                    lambda key: doc_class.Textarea.render(
+                        self, *_defaults_errors(key, self.name),
+                        error_wrapper = error_wrapper, inner_content = inner_content
+                    ),
+                    _PAIRS
+                )
+
+        class Option(doc_class.Option): # type: ignore
+            def render(self, defaults, errors, inner_content):
+                # type: (Any, Any, str) -> Any
+                def render_function(selected):
+                    # type: (bool) -> str
+                    self.selected = lambda defaults: selected
+                    try:
+                        return doc_class.Option.render(self, {}, {}, inner_content)
+                    finally:
+                        del self.selected
+                return OptionHook(self, render_function, (False, True))
+
+        class SelectTag(doc_class.SelectTag): # type: ignore
+            __slots__ = ()
+
+            def consume(self, captured):
+                # type: (List[Any]) -> None
+                # the options are hooks, kept as separate parts of the template
+                doc = self.doc
+                select = doc.__class__.Select(self.name, self.attrs)
+                doc._append(SelectHook(
+                    select,
+                    lambda has_error: select.render(
+                        {}, {select.name: _ERROR} if has_error else {},
+                        error_wrapper = doc.error_wrapper
+                    )[:-len('</%s>' % select.tag_name)],
+                    (False, True)
+                ))
+                doc.result.extend(captured)
+                doc._append('</%s>' % select.tag_name)
+
+        def detached_errors(self, render_function = None):
+            # type: (Any) -> None
+            self._append(DetachedErrorsHook(render_function or self.error_dict_to_string, self._fields))
+
+    return FormRecorder
+
+class FormTemplate(object):
+    """
+    records a render function building an html form once, and renders it again
+    with different defaults and errors
+
+    render_function:
+        a function taking a Doc instance as its only argument.
+        The form must not depend on the defaults and errors
+        (they are always empty during the recording).
+
+    doc_class:
+        the class of the document used for the recording (defaults to Doc).
+        Additional keyword arguments (like `error_wrapper` or `stag_end`) are
+        passed to its constructor.
+    """
+
+    def __init__(self, render_function, doc_class = Doc, **kwargs):
+        # type: (Callable[[Any], Any], Any, Any) -> None
+        doc = _form_recorder_class(doc_class)(**kwargs)
+        render_function(doc)
+        self.fields = frozenset(doc._fields)
+        self._parts = [] # type: List[Any]
+        static = [] # type: List[str]
+        for part in doc.result:
+            if isinstance(part, str):
+                static.append(part)
+            else:
+                if static:
+                    self._parts.append(''.join(static))
+                    static = []
+                self._parts.append(part)
+        if static:
+            self._parts.append(''.join(static))
+
+    def _fill(self, defaults, errors):
+        # type: (IndexedDefaults, Dict[str, Any]) -> List[str]
+        return [
+            part if isinstance(part, str) else part.render(defaults, errors)
+            for part in self._parts
+        ]
+
+    def render(self, defaults = None, errors = None):
+        # type: (Optional[Dict[str, Any]], Optional[Dict[str, Any]]) -> str
+        """
+        returns the form rendered with the given defaults and errors
+        """
+        return ''.join(self._fill(IndexedDefaults(defaults or {}), errors or {}))
+
+    def append_to(self, doc):
+        # type: (Doc) -> None
+        """
+        appends the form to `doc`, rendered with the defaults and errors of `doc`
+        """
+        doc._fields.update(self.fields)
+        doc.result.extend(self._fill(doc._indexed_defaults(), doc.errors))